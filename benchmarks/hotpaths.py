@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Microbenchmarks of client-side hot paths with synthetic fleets.
+
+Usage: python3 benchmarks/hotpaths.py [--sizes 100,1000,10000,50000]
+                                      [--memory]
+
+Per-call times are the best of --repeat runs, so that regressions are not
+hidden by noise. Requires the expyrimenter core package.
+"""
+from expyrimenter.plugins.cloudstack.api import API, SignedAPICall
+from expyrimenter.plugins.cloudstack.statemonitor import StateMonitor
+import argparse
+import json
+import timeit
+import tracemalloc
+
+
+def fleet(size, state='Running'):
+    """listVirtualMachines items similar to the real ones."""
+    return [{'id': '{:08x}-1c4e-4a1e-9b0a-{:012x}'.format(i, i),
+             'name': 'vm{}'.format(i), 'displayname': 'vm{}'.format(i),
+             'account': 'experiments', 'domainid': 'domain-id',
+             'domain': 'ROOT', 'created': '2015-01-01T00:00:00-0200',
+             'state': state, 'haenable': False, 'zoneid': 'zone-id',
+             'zonename': 'zone1', 'hostid': 'host-id',
+             'hostname': 'host{}'.format(i % 32), 'templateid': 'tpl-id',
+             'templatename': 'debian', 'serviceofferingid': 'offering-id',
+             'serviceofferingname': 'small', 'cpunumber': 1, 'cpuspeed': 1000,
+             'memory': 1024, 'guestosid': 'os-id', 'rootdeviceid': 0,
+             'rootdevicetype': 'ROOT', 'hypervisor': 'KVM',
+             'nic': [{'id': 'nic-id', 'networkid': 'net-id',
+                      'ipaddress': '10.0.{}.{}'.format(i // 250, i % 250),
+                      'isdefault': True}]}
+            for i in range(size)]
+
+
+def response(size):
+    data = {'listvirtualmachinesresponse': {'count': size,
+                                            'virtualmachine': fleet(size)}}
+    return json.dumps(data).encode()
+
+
+class OfflineAPI(API):
+    """API answering every request with the same response, without config
+    or network.
+    """
+    def __init__(self, body=b'{}'):
+        SignedAPICall.__init__(self, 'https://cloud/client/api', 'key' * 20,
+                               'secret' * 15)
+        self.body = body
+
+    def _http_get(self, url):
+        return self.body
+
+
+def per_call(stmt, number, repeat):
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number
+
+
+def bench_fixed(repeat):
+    args = {'id': '0123-4567', 'zoneid': 'zone-id', 'name': 'vm 1',
+            'details[0].key': 'value&more', 'forced': True}
+    call = SignedAPICall('https://cloud/client/api', 'key' * 20,
+                         'secret' * 15)
+    api = OfflineAPI()
+    yield 'request signing', None, per_call(
+        lambda: call.request(dict(args)), 10000, repeat)
+    yield 'quote', None, per_call(lambda: call._quote('vm 1&x'), 100000,
+                                  repeat)
+    yield 'API.__getattr__', None, per_call(
+        lambda: api.listVirtualMachines, 100000, repeat)
+
+
+def bench_fleet(size, repeat):
+    number = max(1, 20000 // size)
+    body = response(size)
+    api = OfflineAPI(body)
+    yield 'json parse', size, per_call(lambda: json.loads(body.decode()),
+                                       number, repeat)
+    yield '_make_request', size, per_call(api.listVirtualMachines, number,
+                                          repeat)
+
+    vms = fleet(size)
+    monitor = StateMonitor({}, api=api)
+    for vm in vms:
+        monitor._update_state(vm['name'], vm['state'])
+
+    def unchanged():
+        for vm in vms:
+            monitor._update_state(vm['name'], vm['state'])
+
+    changes = [(vm['name'], 'Stopped') for vm in vms[::100]]
+    undo = [(name, 'Running') for name, _ in changes]
+
+    def one_percent():
+        for name, state in changes:
+            monitor._update_state(name, state)
+        for name, state in undo:
+            monitor._update_state(name, state)
+        unchanged()
+
+    yield 'state diff, none changed', size, per_call(unchanged, number,
+                                                     repeat)
+    yield 'state diff, 1% changed', size, per_call(one_percent, number,
+                                                   repeat)
+
+
+def peak_memory(size):
+    body = response(size)
+    tracemalloc.start()
+    vms = json.loads(body.decode())['listvirtualmachinesresponse'][
+        'virtualmachine']
+    monitor = StateMonitor({}, api=OfflineAPI(body))
+    for vm in vms:
+        monitor._update_state(vm['name'], vm['state'])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='100,1000,10000,50000',
+                        help='comma-separated fleet sizes')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--memory', action='store_true',
+                        help='also report peak memory of parsing and diffing')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print('{:<28} {:>7} {:>14}'.format('benchmark', 'VMs', 'per call'))
+    results = list(bench_fixed(args.repeat))
+    for size in sizes:
+        results += bench_fleet(size, args.repeat)
+    for name, size, seconds in results:
+        print('{:<28} {:>7} {:>12.2f}us'.format(
+            name, size or '-', seconds * 1e6))
+    if args.memory:
+        for size in sizes:
+            print('{:<28} {:>7} {:>12.1f}MB'.format(
+                'peak memory', size, peak_memory(size) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
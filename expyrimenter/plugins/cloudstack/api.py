@@ -6,6 +6,7 @@
 #   - method calls work without any parameter
 #   - pep8 compliance
 
+from .profiling import Profiler
 from expyrimenter.core import Config, ExpyLogger
 from urllib.parse import quote_plus
 from urllib.request import urlopen
@@ -92,10 +93,11 @@ class API(SignedAPICall):
         return response.read()
 
     def _make_request(self, command, args):
-        args['response'] = 'json'
-        args['command'] = command
-        self.request(args)
-        data = self._http_get(self.value).decode()
-        # The response is of the format {commandresponse: actual-data}
-        key = command.lower() + "response"
-        return json.loads(data)[key]
+        with Profiler.profile(command):
+            args['response'] = 'json'
+            args['command'] = command
+            self.request(args)
+            data = self._http_get(self.value).decode()
+            # The response is of the format {commandresponse: actual-data}
+            key = command.lower() + "response"
+            return json.loads(data)[key]
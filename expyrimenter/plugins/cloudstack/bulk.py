@@ -0,0 +1,105 @@
+from .scheduler import JobFailed
+from .tasks import CancelToken, TaskHandle, clock_thread
+from collections import namedtuple
+from concurrent.futures import Future
+
+VMResult = namedtuple('VMResult', 'vm success duration error')
+VMResult.__doc__ = """Outcome of one VM in a bulk operation. *duration* is
+the time from the request until the target state was seen, 0 if the VM
+was already there."""
+
+
+class BulkOperation:
+    """Brings many VMs to a target state from a single thread.
+
+    At most *concurrency* VMs are on their way at the same time. Each round
+    uses one listVirtualMachines and one listAsyncJobs call, no matter how
+    many VMs there are.
+    """
+    def __init__(self, cloudstack, names, target, transitional, request,
+                 concurrency=10, deadline=None, interval=5):
+        """
+        :param str target: state, e.g. 'Running'.
+        :param str transitional: state on the way to *target*, e.g.
+            'Starting', in which VMs are not requested again.
+        :param request: callable receiving a VM id and returning the API
+            response with a ``jobid``.
+        """
+        self.target = target
+        self.transitional = transitional
+        self.concurrency = concurrency
+        self.interval = interval
+        self._cs = cloudstack
+        self._request = request
+        self._pending = list(names)
+        self._inflight = {}  # name: (request time, jobid or None)
+        self._results = {}  # name: VMResult
+        self._token = CancelToken(cloudstack.clock, deadline)
+        self._future = Future()
+        self._future.set_running_or_notify_cancel()
+
+    def start(self):
+        """:returns: TaskHandle whose result is a VMResult dict by name."""
+        clock_thread(self._cs.clock, self._run).start()
+        return TaskHandle(self._future, self._token)
+
+    @property
+    def results(self):
+        """Results so far."""
+        return dict(self._results)
+
+    def _run(self):
+        try:
+            while self._pending or self._inflight:
+                states = self._cs.get_states()
+                self._check_states(states)
+                self._check_jobs()
+                self._token.check()
+                self._send_requests(states)
+                if self._pending or self._inflight:
+                    self._token.sleep(self.interval)
+        except Exception as e:
+            for vm in self._pending + list(self._inflight):
+                self._fail(vm, e)
+        self._future.set_result(self.results)
+
+    def _check_states(self, states):
+        for vm in list(self._inflight):
+            if states.get(vm) == self.target:
+                began = self._inflight.pop(vm)[0]
+                self._finish(vm, True, self._cs.clock.time() - began)
+
+    def _check_jobs(self):
+        if not any(jobid for _, jobid in self._inflight.values()):
+            return
+        jobs = self._cs.get_jobs()
+        for vm, (_, jobid) in list(self._inflight.items()):
+            job = jobs.get(jobid, {})
+            if job.get('jobstatus') == 2:
+                msg = '{} job {} failed: {}'.format(
+                    vm, jobid, job.get('jobresult', {}).get('errortext'))
+                self._fail(vm, JobFailed(msg))
+
+    def _send_requests(self, states):
+        while self._pending and len(self._inflight) < self.concurrency:
+            vm = self._pending.pop(0)
+            now = self._cs.clock.time()
+            state = states.get(vm)
+            if state == self.target:
+                self._finish(vm, True, 0)
+            elif state == self.transitional:
+                self._inflight[vm] = (now, None)
+            else:
+                try:
+                    response = self._request(self._cs.get_id(vm))
+                    self._inflight[vm] = (now, response.get('jobid'))
+                except Exception as e:
+                    self._fail(vm, e)
+
+    def _fail(self, vm, error):
+        began = self._inflight.pop(vm, (None,))[0]
+        duration = None if began is None else self._cs.clock.time() - began
+        self._finish(vm, False, duration, error)
+
+    def _finish(self, vm, success, duration, error=None):
+        self._results[vm] = VMResult(vm, success, duration, error)
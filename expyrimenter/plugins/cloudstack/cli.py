@@ -0,0 +1,225 @@
+"""Fleet operations from the command line.
+
+Examples::
+
+    python -m expyrimenter.plugins.cloudstack status
+    python -m expyrimenter.plugins.cloudstack start -c 20 vm1 vm2 vm3
+    python -m expyrimenter.plugins.cloudstack stop --format ndjson vm1 vm2
+    python -m expyrimenter.plugins.cloudstack deploy-like vm1 vm4 vm5
+    python -m expyrimenter.plugins.cloudstack pool-get 2 vm1 vm2 vm3
+"""
+from .cloudstack import CloudStack, VMNotFound
+from .pool import Pool
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import json
+import math
+import sys
+
+
+def main(argv=None, cloudstack=None, out=None):
+    """:returns: exit status, 0 if every operation succeeded."""
+    args = _parse_args(argv)
+    if cloudstack is None:
+        cloudstack = CloudStack(scheduler=True)
+    report = Report(args.format, cloudstack.clock,
+                    sys.stdout if out is None else out)
+    if args.command == 'status':
+        _status(cloudstack, args, report)
+        report.summary()
+    elif args.command == 'pool-get':
+        _pool_get(cloudstack, args, report)
+    else:
+        _run_bounded(cloudstack, args, report)
+        report.summary()
+    return 0 if report.succeeded else 1
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted *values*."""
+    if not values:
+        return None
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class Report:
+    """Prints one line per VM as operations finish and a latency summary."""
+    PERCENTILES = (50, 90, 99, 100)
+
+    def __init__(self, fmt, clock, out):
+        self._ndjson = fmt == 'ndjson'
+        self._clock = clock
+        self._out = out
+        self._began = clock.time()
+        self._durations = []
+        self._ok = 0
+        self._failures = 0
+
+    @property
+    def succeeded(self):
+        return self._failures == 0
+
+    def vm(self, vm, op, duration=None, error=None, **extra):
+        if error is None:
+            self._ok += 1
+            if duration is not None:
+                self._durations.append(duration)
+        else:
+            self._failures += 1
+        record = {'vm': vm, 'op': op,
+                  'status': 'ok' if error is None else 'failed'}
+        if duration is not None:
+            record['seconds'] = round(duration, 3)
+        if error is not None:
+            record['error'] = str(error) or type(error).__name__
+        record.update(extra)
+        if self._ndjson:
+            self._print(json.dumps(record, sort_keys=True))
+        else:
+            fields = [vm, op, record['status']]
+            if duration is not None:
+                fields.append('{:.1f}s'.format(duration))
+            fields += ['{}={}'.format(k, v) for k, v in sorted(extra.items())]
+            if error is not None:
+                fields.append(record['error'])
+            self._print('  '.join(fields))
+
+    def summary(self):
+        durations = sorted(self._durations)
+        summary = {'ok': self._ok, 'failed': self._failures,
+                   'seconds': round(self._clock.time() - self._began, 3)}
+        for p in Report.PERCENTILES:
+            value = percentile(durations, p)
+            summary['p{}'.format(p)] = None if value is None \
+                else round(value, 3)
+        if self._ndjson:
+            self._print(json.dumps({'summary': summary}, sort_keys=True))
+        else:
+            latencies = ' '.join('p{}={}s'.format(p, summary['p{}'.format(p)])
+                                 for p in Report.PERCENTILES)
+            self._print('{ok} ok, {failed} failed in {seconds}s'.format(
+                **summary) + ('; ' + latencies if durations else ''))
+
+    def _print(self, line):
+        print(line, file=self._out, flush=True)
+
+
+def _status(cs, args, report):
+    """Unlike CloudStack.get_states, fails if VMs cannot be listed."""
+    try:
+        vms = cs._api.listVirtualMachines().get('virtualmachine', [])
+    except Exception as e:
+        report.vm('-', 'status', error=e)
+        return
+    states = {vm['name']: vm['state'] for vm in vms}
+    names = args.vms if args.vms else sorted(states)
+    for vm in names:
+        if vm in states:
+            report.vm(vm, 'status', state=states[vm])
+        else:
+            report.vm(vm, 'status', error='not found')
+
+
+def _pool_get(cs, args, report):
+    pool = Pool(args.vms, cloudstack=cs)
+    began = cs.clock.time()
+    ready = 0
+    for vm in pool.iter_ready(args.amount, args.deadline, args.spare):
+        report.vm(vm, 'pool-get', cs.clock.time() - began)
+        ready += 1
+    if ready < args.amount:
+        report.vm('-', 'pool-get', error='only {} of {} VMs are ready'.format(
+            ready, args.amount))
+    report.summary()
+
+
+def _run_bounded(cs, args, report):
+    """Run the operation of each VM with at most ``args.concurrency`` of them
+    at the same time.
+    """
+    if args.command == 'deploy-like':
+        op, vms = _deploy_like, args.vms[1:]
+    else:
+        op, vms = {'start': _start, 'stop': _stop}[args.command], args.vms
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {pool.submit(_timed, cs, op, vm, args): vm for vm in vms}
+        for future in as_completed(futures):
+            duration, error = future.result()
+            report.vm(futures[future], args.command, duration, error)
+
+
+def _timed(cs, op, vm, args):
+    began = cs.clock.time()
+    try:
+        op(cs, vm, args)
+    except Exception as e:
+        return cs.clock.time() - began, e
+    return cs.clock.time() - began, None
+
+
+def _start(cs, vm, args):
+    handles = cs.start(vm, deadline=args.deadline)
+    if vm not in handles:
+        raise VMNotFound('VM "{}" not found.'.format(vm))
+    handles[vm].result()
+
+
+def _stop(cs, vm, args):
+    response = cs.stop_vm(cs.get_id(vm))
+    cs.wait_job(response['jobid'], deadline=args.deadline)
+
+
+def _deploy_like(cs, vm, args):
+    cs.deploy_like(args.vms[0], vm, args.deadline).result()
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m expyrimenter.plugins.cloudstack',
+        description='Operate CloudStack VMs in parallel.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    status = commands.add_parser('status', help='show VM states')
+    _add_format(status)
+    status.add_argument('vms', nargs='*', metavar='VM',
+                        help='all VMs if none is given')
+
+    for name, helptext in (('start', 'start VMs and wait for SSH'),
+                           ('stop', 'stop VMs')):
+        command = commands.add_parser(name, help=helptext)
+        _add_common(command)
+        command.add_argument('vms', nargs='+', metavar='VM')
+
+    deploy = commands.add_parser('deploy-like',
+                                 help='deploy VMs like an existent one')
+    _add_common(deploy)
+    deploy.add_argument('vms', nargs='+', metavar='VM',
+                        help='existent VM followed by new VM names')
+
+    pool = commands.add_parser('pool-get', help='get VMs ready for SSH')
+    _add_format(pool)
+    pool.add_argument('--deadline', type=float, help='seconds to wait')
+    pool.add_argument('--spare', type=int, default=0,
+                      help='extra VMs to start')
+    pool.add_argument('amount', type=int)
+    pool.add_argument('vms', nargs='+', metavar='VM')
+
+    args = parser.parse_args(argv)
+    if args.command == 'deploy-like' and len(args.vms) < 2:
+        parser.error('deploy-like needs an existent VM and new VM names')
+    return args
+
+
+def _add_format(parser):
+    parser.add_argument('--format', choices=('human', 'ndjson'),
+                        default='human', help='output format')
+
+
+def _add_common(parser):
+    _add_format(parser)
+    parser.add_argument('-c', '--concurrency', type=int, default=10,
+                        help='maximum simultaneous operations')
+    parser.add_argument('--deadline', type=float,
+                        help='seconds to wait for each VM')
@@ -1,7 +1,11 @@
 from .api import API
+from .bulk import BulkOperation
+from .scheduler import JobFailed, LifecycleScheduler
 from .statemonitor import StateMonitorProcess
-from time import sleep
+from .tasks import CancelToken, SSHProbe, TaskHandle
+from functools import partial
 import threading
+import time
 from expyrimenter.core import SSH, Executor, Function, ExpyLogger
 
 
@@ -12,10 +16,28 @@ class VMNotFound(Exception):
 class CloudStack:
     """Currently, only API calls are blocking. To block everything, call wait()
     in the executor attribute.
+
+    With ``scheduler=True``, VMs are started and deployed by a
+    LifecycleScheduler instead of the executor. The returned handles must be
+    used to wait for them. Unlike the executor tasks, which start VMs again
+    if they stop while booting, the scheduler does not retry failed starts;
+    Pool starts other VMs in their place.
     """
     _id_cache = None
 
-    def __init__(self, executor=None, api=None, logger_name=None):
+    def __init__(self, executor=None, api=None, logger_name=None,
+                 monitor=None, ssh=None, clock=None, probe=None,
+                 scheduler=False):
+        """The last four parameters allow replacing real infrastructure,
+        e.g. by the ones in the simulator module.
+
+        :param monitor: StateMonitorProcess (default) or StateMonitorThread.
+        :param ssh: provides ``await_availability(host, interval)``.
+        :param clock: provides ``time()`` and ``sleep(seconds)``.
+        :param probe: provides non-blocking ``is_available(host)`` for SSH,
+            e.g. ``SSHProbe(port=22)`` to skip logins while the port is
+            closed.
+        """
         if executor is None:
             executor = Executor()
         if api is None:
@@ -25,6 +47,10 @@ class CloudStack:
 
         self.executor = executor
         self._api = api
+        self._monitor = StateMonitorProcess if monitor is None else monitor
+        self._ssh = SSH if ssh is None else ssh
+        self.clock = time if clock is None else clock
+        self._probe = SSHProbe() if probe is None else probe
         self._logger_name = logger_name
         self._logger = ExpyLogger.getLogger(name=logger_name)
 
@@ -32,10 +58,26 @@ class CloudStack:
         self._sm_lock = threading.Lock()
         self._sm_tasks = 0
 
+        self._scheduler = LifecycleScheduler(self) if scheduler else None
+
     def get_states(self, **kwargs):
         vms = self._list_vms(**kwargs)
         return {vm['name']: vm['state'] for vm in vms}
 
+    def get_hosts(self, **kwargs):
+        """Host names are only available to admins and for running VMs."""
+        vms = self._list_vms(**kwargs)
+        return {vm['name']: vm['hostname'] for vm in vms if 'hostname' in vm}
+
+    def get_jobs(self, **kwargs):
+        """Async jobs by id."""
+        try:
+            jobs = self._api.listAsyncJobs(**kwargs).get('asyncjobs', [])
+        except Exception as e:
+            self._logger.failure('list async jobs', e)
+            jobs = []
+        return {job['jobid']: job for job in jobs}
+
     # throws VMNotFound
     def get_state(self, name):
         vm_id = self.get_id(name)
@@ -55,15 +97,30 @@ class CloudStack:
 
         return CloudStack._id_cache[name]
 
-    def start(self, *names):
+    def start(self, *names, deadline=None):
+        """
+        :param float deadline: seconds to wait for SSH.
+        :returns: TaskHandle of the tasks that wait for SSH, by VM name.
+        """
+        handles = {}
+        operations = []  # for the scheduler
         names = ensure_list(names)
         for vm in names:
             title = 'start VM ' + vm
             try:
                 vm_id = self.get_id(vm)
-                self._submit_sm_task(self.start_vm, title, vm_id, vm)
+                if self._scheduler is None:
+                    handles[vm] = self._submit_sm_task(self.start_vm, title,
+                                                       deadline, vm_id, vm)
+                else:
+                    request = partial(self._api.startVirtualMachine, id=vm_id)
+                    operations.append((title, vm, request))
             except VMNotFound:
                 pass  # Already logged in get_id. Do not quit the loop.
+        if operations:
+            submitted = self._scheduler.submit_many(operations, deadline)
+            handles.update(zip([vm for _, vm, _ in operations], submitted))
+        return handles
 
     def stop(self, *names):
         names = ensure_list(names)
@@ -75,10 +132,27 @@ class CloudStack:
             except VMNotFound:
                 pass  # Already logged in get_id. Stop next VMs.
 
-    def deploy_like(self, existent, new, **kwargs):
+    def start_many(self, names, concurrency=10, deadline=None, interval=5):
+        """Start VMs, with at most *concurrency* of them starting at the
+        same time, and confirm they are running.
+
+        :param float deadline: seconds for the whole operation.
+        :returns: TaskHandle whose result is a dict of VMResult by name.
+        """
+        return BulkOperation(self, ensure_list([names]), 'Running',
+                             'Starting', self._start_request, concurrency,
+                             deadline, interval).start()
+
+    def stop_many(self, names, concurrency=10, deadline=None, interval=5):
+        """Like :meth:`start_many`, but for stopping VMs."""
+        return BulkOperation(self, ensure_list([names]), 'Stopped',
+                             'Stopping', self.stop_vm, concurrency, deadline,
+                             interval).start()
+
+    def deploy_like(self, existent, new, deadline=None, **kwargs):
         params = self.get_deploy_params(existent)
         params['name'] = new
-        self.deploy(params, **kwargs)
+        return self.deploy(params, deadline, **kwargs)
 
     def get_deploy_params(self, name):
         params = {}
@@ -91,11 +165,20 @@ class CloudStack:
             params[key] = vm[key]
         return params
 
-    def deploy(self, params, **kwargs):
+    def deploy(self, params, deadline=None, **kwargs):
+        """
+        :param float deadline: seconds to wait for SSH.
+        :rtype: TaskHandle
+        """
         if kwargs:
             params.update(kwargs)
         vm = params['name']
-        self._submit_sm_task(self.deploy_vm, 'deploy VM ' + vm, params)
+        title = 'deploy VM ' + vm
+        if self._scheduler is None:
+            return self._submit_sm_task(self.deploy_vm, title, deadline,
+                                        params)
+        request = partial(self._api.deployVirtualMachine, **params)
+        return self._scheduler.submit(title, vm, request, deadline)
 
     def load_id_cache(self):
         vms = self._list_vms()
@@ -109,55 +192,103 @@ class CloudStack:
             vms = {}
         return vms
 
-    def _submit_sm_task(self, fn, title, *args, **kwargs):
-        with self._sm_lock:
-            self._sm_tasks += 1
-            if self._sm_tasks == 1:
-                StateMonitorProcess.start(interval=10)
-
-        future = self._submit_task(fn, title, *args, **kwargs)
+    def _submit_sm_task(self, fn, title, deadline, *args):
+        """*fn* receives a CancelToken as the ``token`` keyword argument."""
+        self._acquire_monitor()
+        token = CancelToken(self.clock, deadline)
+        future = self._submit_task(fn, title, *args, token=token)
         future.add_done_callback(self._sm_task_done)
 
-        return future
+        return TaskHandle(future, token)
 
     def _submit_task(self, fn, title, *args, **kwargs):
         f = Function(fn, title=title, logger_name=self._logger_name)
         f.set_args(*args, **kwargs)
         return self.executor.run(f)
 
-    # pylint: disable=unused-argument
-    def _sm_task_done(self, future):
+    def _acquire_monitor(self):
+        with self._sm_lock:
+            self._sm_tasks += 1
+            if self._sm_tasks == 1:
+                self._monitor.start(interval=10)
+
+    def _release_monitor(self):
         with self._sm_lock:
             self._sm_tasks -= 1
             if self._sm_tasks == 0:
-                StateMonitorProcess.stop()
+                self._monitor.stop()
 
-    def start_vm(self, vm_id, vm):
+    # pylint: disable=unused-argument
+    def _sm_task_done(self, future):
+        self._release_monitor()
+
+    def start_vm(self, vm_id, vm, token=None):
+        if token is None:
+            token = CancelToken(self.clock)
+        token.check()  # it may have waited too long in the executor queue
         self._api.startVirtualMachine(id=vm_id)
-        self.wait_ssh(vm)
+        self.wait_ssh(vm, token=token)
+
+    def _start_request(self, vm_id):
+        return self._api.startVirtualMachine(id=vm_id)
 
     def stop_vm(self, vm_id):
-        self._api.stopVirtualMachine(id=vm_id)
+        return self._api.stopVirtualMachine(id=vm_id)
 
-    def deploy_vm(self, params):
+    def deploy_vm(self, params, token=None):
+        if token is None:
+            token = CancelToken(self.clock)
+        token.check()
         self._api.deployVirtualMachine(**params)
         vm = params['name']
-        self.wait_ssh(vm)
-
-    def wait_ssh(self, vm, interval=10):
-        self.wait_state(vm, 'Running', interval)
-        SSH.await_availability(vm, interval)
-
-    def wait_state(self, vm, state, interval):
-        states = StateMonitorProcess.get_states()
+        self.wait_ssh(vm, token=token)
+
+    def wait_ssh(self, vm, interval=10, deadline=None, token=None):
+        """Raises Cancelled or DeadlineExceeded from CancelToken.
+
+        :param float deadline: seconds, ignored if *token* is given.
+        """
+        if token is None:
+            token = CancelToken(self.clock, deadline)
+        self.wait_state(vm, 'Running', interval, token)
+        while not self._probe.is_available(vm):
+            token.sleep(interval)
+        self._ssh.await_availability(vm, interval)
+
+    def wait_job(self, jobid, interval=5, deadline=None, token=None):
+        """Wait for an async job and return its result.
+
+        :raises JobFailed: if the job fails.
+        """
+        if token is None:
+            token = CancelToken(self.clock, deadline)
+        while True:
+            job = self._api.queryAsyncJobResult(jobid=jobid)
+            if job['jobstatus'] == 1:
+                return job.get('jobresult')
+            if job['jobstatus'] == 2:
+                raise JobFailed('job {} failed: {}'.format(
+                    jobid, job.get('jobresult', {}).get('errortext')))
+            token.sleep(interval)
+
+    def wait_state(self, vm, state, interval, token=None):
+        if token is None:
+            token = CancelToken(self.clock)
+        states = self._monitor.get_states()
+        # The monitor may still have the state before our request
+        left_stopped = False
         while True:
             if state == states.get(vm):
                 break
-            sleep(interval)
-            if state == 'Running' and states.get(vm) == 'Stopped':
+            token.sleep(interval)
+            current = states.get(vm)
+            if current not in (None, 'Stopped'):
+                left_stopped = True
+            elif state == 'Running' and left_stopped:
                 vm_id = self.get_id(vm)
-                self._logger.info('starting {} again'.format())
+                self._logger.info('starting {} again'.format(vm))
                 self._api.startVirtualMachine(id=vm_id)
+                left_stopped = False
 
 
 def ensure_list(args):
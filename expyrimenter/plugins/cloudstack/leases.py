@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+import uuid
+
+
+class LeaseManager:
+    """Exclusive, expiring VM leases shared by processes of the same host.
+
+    Leases are rows of a SQLite database and every allocation happens in a
+    single write transaction, so two processes never get the same VM.
+    """
+    DEFAULT_PATH = '~/.expyrimenter/cloudstack_leases.sqlite'
+
+    def __init__(self, path=None, ttl=3600, owner=None, clock=None):
+        """
+        :param float ttl: seconds until a lease expires if not renewed.
+        :param str owner: lease owner, unique per object by default.
+        :param clock: provides ``time()``.
+        """
+        if path is None:
+            path = LeaseManager.DEFAULT_PATH
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.owner = '{}-{}'.format(os.getpid(), uuid.uuid4().hex[:8]) \
+            if owner is None else owner
+        self._clock = time if clock is None else clock
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS leases ('
+                       'vm TEXT PRIMARY KEY, owner TEXT, expires REAL)')
+
+    def acquire(self, vms, amount):
+        """Lease up to *amount* VMs of *vms* that are not leased by others.
+        VMs this owner already leases come first, then the given order.
+
+        :returns: leased VMs, including the ones this owner already had.
+        :rtype: list
+        """
+        now = self._clock.time()
+        with self._transaction() as db:
+            db.execute('DELETE FROM leases WHERE expires < ?', (now,))
+            taken = self._others(db)
+            mine = self._mine(db)
+            vms = sorted(vms, key=lambda vm: vm not in mine)
+            leased = [vm for vm in vms if vm not in taken][:amount]
+            db.executemany('INSERT OR REPLACE INTO leases VALUES (?, ?, ?)',
+                           [(vm, self.owner, now + self.ttl)
+                            for vm in leased])
+        return leased
+
+    def release(self, vms=None):
+        """Release leases of *vms* or all of this owner."""
+        with self._transaction() as db:
+            if vms is None:
+                db.execute('DELETE FROM leases WHERE owner = ?',
+                           (self.owner,))
+            else:
+                db.executemany('DELETE FROM leases WHERE vm = ? AND owner = ?',
+                               [(vm, self.owner) for vm in vms])
+
+    def renew(self, vms=None):
+        """Extend leases of *vms* or all of this owner by the TTL."""
+        expires = self._clock.time() + self.ttl
+        with self._transaction() as db:
+            if vms is None:
+                db.execute('UPDATE leases SET expires = ? WHERE owner = ?',
+                           (expires, self.owner))
+            else:
+                db.executemany('UPDATE leases SET expires = ? '
+                               'WHERE vm = ? AND owner = ?',
+                               [(expires, vm, self.owner) for vm in vms])
+
+    def leased_by_others(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM leases WHERE expires < ?',
+                       (self._clock.time(),))
+            return self._others(db)
+
+    def _others(self, db):
+        rows = db.execute('SELECT vm FROM leases WHERE owner != ?',
+                          (self.owner,))
+        return {row[0] for row in rows}
+
+    def _mine(self, db):
+        rows = db.execute('SELECT vm FROM leases WHERE owner = ?',
+                          (self.owner,))
+        return {row[0] for row in rows}
+
+    @contextmanager
+    def _transaction(self):
+        """Writers of other processes wait for this transaction."""
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        finally:
+            db.close()
@@ -1,17 +1,40 @@
 from .cloudstack import CloudStack
+from .starttimes import StartTimes
+from .tasks import DeadlineExceeded, TaskHandle
 from expyrimenter.core import ExpyLogger
+from collections import OrderedDict
+from concurrent.futures import Future
+import asyncio
+from functools import partial
+import queue
+import threading
 
 
 class Pool:
     RUNNING = 'Running'
     STOPPED = 'Stopped'
 
-    def __init__(self, hostnames=None):
+    def __init__(self, hostnames=None, cloudstack=None, start_times=None,
+                 leases=None):
+        """
+        :param StartTimes start_times: history used to start the fastest VMs
+            first.
+        :param LeaseManager leases: share VMs with other pools, possibly in
+            other processes. Only VMs leased by this pool are returned and
+            they are kept until :meth:`release` or lease expiration. VMs
+            already leased by this pool are returned first and leases of
+            VMs not returned by :meth:`get` are kept as well.
+        """
         self.hostnames = [] if hostnames is None else hostnames
         self._logger = ExpyLogger.getLogger('pool')
-        self._cs = CloudStack()
+        self._cs = CloudStack() if cloudstack is None else cloudstack
+        self._start_times = StartTimes() if start_times is None \
+            else start_times
+        self._leases = leases
         self._states = None  # hostname: state dict
         self._last_started = []
+        self._retried = set()  # started again after failing
+        self._stopping = None  # handle of the last stop()
 
     @property
     def last_started(self):
@@ -20,22 +43,91 @@ class Pool:
     def update(self):
         self._states = None
 
-    def get(self, amount):
-        """Return VMs ready for SSH (blocking)."""
-        running = self.running_vms
+    def get(self, amount, deadline=None, spare=0):
+        """Return VMs ready for SSH (blocking).
+
+        :param float deadline: seconds to wait for VMs to start. Fewer than
+            *amount* VMs are returned if it passes.
+        :param int spare: start extra VMs and stop waiting for the slowest
+            ones as soon as *amount* VMs are ready.
+        """
+        vms = list(self.iter_ready(amount, deadline, spare))
+        if len(vms) < amount:
+            self._logger.error('only {} of {} VMs are ready'.format(
+                len(vms), amount))
+        return vms
+
+    def iter_ready(self, amount, deadline=None, spare=0):
+        """Like :meth:`get`, but yield each VM as soon as it is ready for SSH,
+        running ones first. VMs are started when iteration begins and waits
+        are cancelled if it is stopped early. Other stopped VMs are started
+        in place of the ones that fail.
+        """
+        running = self._lease(self.running_vms, amount)
         to_start = amount - len(running)
-        if to_start > 0:
-            self._start_vms(to_start)
-            running = self.running_vms
-            assert len(running) == amount
-        return running[:amount]
-
-    def stop(self):
-        self._cs.stop(self.running_vms)
-        self.update()
+        if to_start <= 0:
+            yield from running
+            return
+
+        began = self._cs.clock.time()
+        starts = _Starts(self, self._start_vms(to_start, spare, deadline),
+                         to_start, began, deadline)
+        ready = OrderedDict()  # hostname: time when SSH was available
+        finished = False  # not stopped early by the caller
+        try:
+            yield from running
+            for vm, when in starts:
+                ready[vm] = when
+                yield vm
+            finished = True
+        finally:
+            handles = starts.close()
+            # Not ready until now, e.g. spare VMs
+            slow = [vm for vm, handle in handles.items()
+                    if not handle.done() or _expired(handle)] \
+                if finished else []
+            for handle in handles.values():
+                handle.cancel()
+            self.release([vm for vm in self._last_started if vm not in ready])
+            self.update()
+            self._record_start_times(starts.started, ready, slow, starts.last)
+
+    def aiter_ready(self, amount, deadline=None, spare=0):
+        """Asynchronous :meth:`iter_ready` for ``async for``. The waiting
+        happens in the default executor of the event loop.
+        """
+        return _AsyncIterator(self.iter_ready(amount, deadline, spare))
+
+    def stop(self, concurrency=10):
+        """Stop running VMs that are not leased by others. They are leased by
+        this pool until they are stopped.
+
+        :returns: TaskHandle with the result of :meth:`CloudStack.stop_many`,
+            done after the leases are released.
+        """
+        vms = self._lease(self.running_vms, len(self.hostnames))
+        handle = self._cs.stop_many(vms, concurrency)
+        future = Future()
+        future.set_running_or_notify_cancel()
+        handle.add_done_callback(partial(self._stop_done, vms, future))
+        self._stopping = TaskHandle(future, handle.token)
+        return self._stopping
+
+    def release(self, vms=None):
+        """Let other pools use *vms* or all VMs leased by this pool."""
+        if self._leases is not None:
+            self._leases.release(vms)
+
+    def renew(self, vms=None):
+        """Extend the leases of *vms* or all VMs leased by this pool."""
+        if self._leases is not None:
+            self._leases.renew(vms)
 
     def wait(self):
+        """Wait for tasks in the executor and for the last :meth:`stop`."""
         self._cs.executor.wait()
+        if self._stopping is not None:
+            self._stopping.result()
 
     @property
     def states(self):
@@ -60,17 +152,179 @@ class Pool:
         """
         return [h for h in self.hostnames if self.states[h] == state]
 
-    def _start_vms(self, amount):
-        """Start stopped VMs.
+    def _start_vms(self, amount, spare=0, deadline=None):
+        """Start stopped VMs, historically fastest first and spread across
+        hosts.
 
-        :param int n: Positive integer
-        :returns: n started VM hostnames
-        :rtype: list of strings
+        :param int amount: Positive integer
+        :returns: TaskHandle by hostname of *amount* + *spare* VMs
+        :rtype: dict
         """
-        start_us = self.stopped_vms[:amount]
+        ranked = self._start_times.rank(self.stopped_vms)
+        start_us = self._lease(ranked, amount + spare)
         for vm in start_us:
             self._logger.info('starting ' + vm)
-            self._cs.start(vm)
-            self._cs.executor.wait()
         self._last_started = start_us
+        self._retried = set()
+        return self._cs.start(start_us, deadline=deadline)
+
+    def _lease(self, vms, amount):
+        """First *amount* VMs that are not leased by others."""
+        if self._leases is None:
+            return vms[:amount]
+        return self._leases.acquire(vms, amount)
+
+    def _stop_done(self, vms, future, handle):
+        try:
+            self.release(vms)
+            self.update()
+            future.set_result(handle.result())
+        except BaseException as e:  # e.g. database busy or cancelled
+            future.set_exception(e)
+
+    def _replace(self, failed, began, deadline=None):
+        """Start a stopped VM that was not tried yet in place of *failed*, or
+        *failed* itself once if there is none.
+
+        :returns: TaskHandle by hostname, empty if there is no VM or time.
+        :rtype: dict
+        """
+        if deadline is not None:
+            deadline -= self._cs.clock.time() - began
+            if deadline <= 0:
+                return {}
         self.update()
+        stopped = self.stopped_vms
+        ranked = self._start_times.rank(stopped)
+        untried = [vm for vm in ranked if vm not in self._last_started]
+        start_us = self._lease(untried, 1)
+        if start_us:
+            self._logger.info('starting {} in place of {}'.format(
+                start_us[0], failed))
+            self._last_started += start_us
+        elif failed in stopped and failed not in self._retried:
+            self._logger.info('starting {} again'.format(failed))
+            self._retried.add(failed)
+            start_us = [failed]
+        return self._cs.start(start_us, deadline=deadline)
+
+    def _record_start_times(self, started, ready, slow=(), until=None):
+        """Only VMs that are running now have meaningful durations. *slow*
+        VMs took at least until *until*.
+
+        :param dict started: time when each VM was started, by hostname.
+        """
+        running = [vm for vm in ready if self.states[vm] == Pool.RUNNING]
+        if not running and not slow:
+            return
+        for vm in running:
+            self._start_times.record(vm, ready[vm] - started[vm])
+        for vm in slow:
+            self._start_times.record_at_least(vm, until - started[vm])
+        hosts = self._cs.get_hosts(state=Pool.RUNNING)
+        for vm in running:
+            if vm in hosts:
+                self._start_times.set_host(vm, hosts[vm])
+        self._start_times.save()
+
+
+class _Starts:
+    """Iterates over hostnames and times of up to *amount* start tasks that
+    succeed, in the order they finish.
+
+    Failed tasks are replaced by the thread that completes them while the
+    pending ones are not enough, so that replacements do not depend on how
+    fast the tasks are consumed.
+    """
+    def __init__(self, pool, handles, amount, began, deadline=None):
+        """:param dict handles: TaskHandle by hostname."""
+        self._pool = pool
+        self._handles = handles
+        self._amount = amount
+        self._began = began
+        self._deadline = deadline
+        self._lock = threading.Lock()
+        self._done = queue.Queue()  # (hostname, time, success)
+        self._pending = len(handles)
+        self._succeeded = 0
+        self._closed = False
+        self.started = dict.fromkeys(handles, began)  # hostname: time
+        self.last = began  # when the last task consumed by __iter__ finished
+        for vm, handle in list(handles.items()):
+            handle.add_done_callback(partial(self._task_done, vm))
+
+    def __iter__(self):
+        yielded = 0
+        while yielded < self._amount:
+            with self._lock:
+                if not self._pending and self._done.empty():
+                    return
+            vm, when, success = self._done.get()
+            self.last = when
+            if success:
+                yield vm, when
+                yielded += 1
+
+    def close(self):
+        """Stop replacing tasks.
+
+        :returns: all handles by hostname, including replacements.
+        :rtype: dict
+        """
+        with self._lock:
+            self._closed = True
+            return dict(self._handles)
+
+    def _task_done(self, vm, handle):
+        success = handle.succeeded()
+        when = self._pool._cs.clock.time()
+        replacement = {}
+        with self._lock:
+            self._pending -= 1
+            if success:
+                self._succeeded += 1
+            elif not self._closed and \
+                    self._succeeded + self._pending < self._amount:
+                replacement = self._pool._replace(vm, self._began,
+                                                  self._deadline)
+                self._handles.update(replacement)
+                self.started.update(dict.fromkeys(replacement, when))
+                self._pending += len(replacement)
+            self._done.put((vm, when, success))
+        for new, new_handle in replacement.items():
+            new_handle.add_done_callback(partial(self._task_done, new))
+
+
+def _expired(handle):
+    return not handle.future.cancelled() and \
+        isinstance(handle.future.exception(), DeadlineExceeded)
+
+
+class _AsyncIterator:
+    """Adapts a blocking iterator to the asynchronous iterator protocol."""
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._lock = threading.Lock()  # the iterator runs in one thread
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._next)
+
+    async def aclose(self):
+        """Stop the underlying iterator, cancelling pending waits."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._close)
+
+    def _next(self):
+        with self._lock:
+            try:
+                return next(self._iterator)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    def _close(self):
+        with self._lock:
+            self._iterator.close()
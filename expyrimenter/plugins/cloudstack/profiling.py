@@ -0,0 +1,146 @@
+"""Opt-in CPU and memory profiling of API requests and monitor rounds.
+
+Enable it by setting the EXPYRIMENTER_CLOUDSTACK_PROFILE environment variable
+to a directory (and EXPYRIMENTER_CLOUDSTACK_PROFILE_MEMORY to trace memory)
+before importing this package, or by calling :meth:`Profiler.enable`. Stats
+are dumped per command when the process exits or by :meth:`Profiler.dump`:
+``<pid>-<command>.prof`` files for pstats and ``<pid>-summary.txt`` with call
+counts, time and peak memory.
+
+Peak memory is the highest amount of memory traced during a block above the
+amount at its beginning (Python >= 3.9). It is only measured for the
+outermost blocks. The peak of tracemalloc is shared by all threads, so blocks
+that overlap with other outermost blocks, e.g. in the scheduler and executor
+threads, are left out. Memory allocated meanwhile by threads outside blocks
+is still counted.
+"""
+from contextlib import contextmanager
+import atexit
+import cProfile
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+
+class Profiler:
+    directory = None
+    memory = False
+    _lock = threading.Lock()
+    _local = threading.local()
+    _stats = {}  # name: pstats.Stats
+    _summary = {}  # name: [calls, seconds, max peak bytes]
+    _memory_blocks = 0  # outermost blocks running
+    _memory_entries = 0  # outermost blocks started so far
+
+    @classmethod
+    def enable(cls, directory, memory=False):
+        """
+        :param bool memory: also trace memory allocations, which is slow.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if cls.directory is None:
+            atexit.register(cls.dump)
+        cls.directory = directory
+        cls.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def disable(cls):
+        cls.directory = None
+        if cls.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        cls.memory = False
+
+    @classmethod
+    @contextmanager
+    def profile(cls, name):
+        """Profile the block as *name*. Blocks nested in the same thread are
+        timed, but their cProfile stats are only in the outer one.
+        """
+        if cls.directory is None:
+            yield
+            return
+        outer = not getattr(cls._local, 'active', False)
+        profile = None
+        if outer:
+            cls._local.active = True
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None  # another thread is profiling (Python >= 3.12)
+        memory = outer and cls.memory and tracemalloc.is_tracing() and \
+            hasattr(tracemalloc, 'reset_peak')
+        if memory:
+            mark = cls._enter_memory()
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            seconds = time.perf_counter() - began
+            peak = cls._exit_memory(*mark) if memory else None
+            if outer:
+                cls._local.active = False
+            cls._add(name, profile, seconds, peak)
+
+    @classmethod
+    def dump(cls):
+        """Write the stats accumulated so far by this process."""
+        with cls._lock:
+            if cls.directory is None or not cls._summary:
+                return
+            prefix = os.path.join(cls.directory, str(os.getpid()))
+            for name, stats in cls._stats.items():
+                name = name.replace(' ', '_')
+                stats.dump_stats('{}-{}.prof'.format(prefix, name))
+            with open(prefix + '-summary.txt', 'w') as f:
+                f.write('command\tcalls\tseconds\tmax_peak_bytes\n')
+                for name, values in sorted(cls._summary.items()):
+                    f.write('{}\t{}\t{:.6f}\t{}\n'.format(name, *values))
+
+    @classmethod
+    def _add(cls, name, profile, seconds, peak):
+        with cls._lock:
+            if profile is not None and name in cls._stats:
+                cls._stats[name].add(profile)
+            elif profile is not None:
+                cls._stats[name] = pstats.Stats(profile)
+            calls, total, max_peak = cls._summary.get(name, (0, 0, 0))
+            cls._summary[name] = (calls + 1, total + seconds,
+                                  max(max_peak, peak or 0))
+
+    @classmethod
+    def _enter_memory(cls):
+        """:returns: whether no other block is running, the memory traced
+            now and the number of blocks started so far.
+        """
+        with cls._lock:
+            alone = not cls._memory_blocks
+            if alone:
+                tracemalloc.reset_peak()
+            cls._memory_blocks += 1
+            cls._memory_entries += 1
+            return (alone, tracemalloc.get_traced_memory()[0],
+                    cls._memory_entries)
+
+    @classmethod
+    def _exit_memory(cls, alone, before, entries):
+        """:returns: peak memory above *before* or None if other blocks ran
+            meanwhile.
+        """
+        with cls._lock:
+            cls._memory_blocks -= 1
+            if alone and entries == cls._memory_entries:
+                return tracemalloc.get_traced_memory()[1] - before
+            return None
+
+
+if os.environ.get('EXPYRIMENTER_CLOUDSTACK_PROFILE'):
+    Profiler.enable(
+        os.environ['EXPYRIMENTER_CLOUDSTACK_PROFILE'],
+        bool(os.environ.get('EXPYRIMENTER_CLOUDSTACK_PROFILE_MEMORY')))
@@ -0,0 +1,197 @@
+from .tasks import (CancelToken, Cancelled, TaskHandle, clock_running,
+                    clock_thread)
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import threading
+import time
+
+
+class JobFailed(Exception):
+    pass
+
+
+class Operation:
+    """State machine of a VM being started or deployed.
+
+    NEW -> SUBMITTED (API request sent) -> JOB_DONE (async job succeeded)
+    -> RUNNING (reported by the state monitor) -> SSH_READY
+    """
+    NEW = 'new'
+    SUBMITTED = 'submitted'
+    JOB_DONE = 'job done'
+    RUNNING = 'Running'
+    SSH_READY = 'SSH ready'
+
+    def __init__(self, title, vm, request, token):
+        """
+        :param str title: used for logging.
+        :param str vm: VM name.
+        :param request: callable that sends the API request and returns its
+            response, which has a ``jobid``.
+        """
+        self.title = title
+        self.vm = vm
+        self.request = request
+        self.token = token
+        self.state = Operation.NEW
+        self.jobid = None
+        self.probe = None  # Future of a running SSH probe
+        self.future = Future()
+        self.future.set_running_or_notify_cancel()
+
+
+class LifecycleScheduler:
+    """Advances all start/deploy operations of a CloudStack object from a
+    single thread, so no thread is held while VMs boot.
+
+    The thread only exists while there are operations. Each round, it sends
+    new requests, checks all async jobs in one listAsyncJobs call, reads the
+    state monitor and probes SSH of running VMs. A VM is only ready when the
+    CloudStack probe succeeds, which tries an SSH login by default (see
+    SSHProbe), because sshd accepts connections before keys are in place.
+    Probes run in a bounded thread pool and the round waits at most
+    *probe_wait* seconds for them. Unfinished probes are checked again in
+    the next rounds.
+    """
+    def __init__(self, cloudstack, interval=10, probes=16, probe_wait=1):
+        """:param int probes: maximum number of concurrent SSH probes."""
+        self.interval = interval
+        self.probes = probes
+        self.probe_wait = probe_wait
+        self._cs = cloudstack
+        self._probe_pool = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._new = []  # operations added since the last round
+        self._ops = []
+        self._thread = None
+
+    def submit(self, title, vm, request, deadline=None):
+        """:rtype: TaskHandle whose result is the VM name."""
+        return self.submit_many([(title, vm, request)], deadline)[0]
+
+    def submit_many(self, operations, deadline=None):
+        """Submit operations that will be first handled in the same round.
+
+        :param operations: (title, vm, request) tuples.
+        :returns: TaskHandle of each operation.
+        :rtype: list
+        """
+        handles = []
+        # Time must not pass between starting the monitor and this thread
+        with clock_running(self._cs.clock), self._lock:
+            for title, vm, request in operations:
+                token = CancelToken(self._cs.clock, deadline)
+                op = Operation(title, vm, request, token)
+                self._cs._acquire_monitor()
+                self._new.append(op)
+                handles.append(TaskHandle(op.future, token,
+                                          on_cancel=self._wakeup.set))
+            if self._thread is None and self._new:
+                self._thread = clock_thread(self._cs.clock, self._run)
+                self._thread.start()
+        return handles
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._ops += self._new
+                self._new = []
+                if not self._ops:
+                    self._thread = None
+                    self._stop_probes()
+                    return
+            self._advance()
+            self._wait()
+
+    def _wait(self):
+        if self._cs.clock is time:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+        else:
+            self._cs.clock.sleep(self.interval)
+
+    def _advance(self):
+        self._send_requests()
+        self._check_jobs()
+        self._check_states()
+        self._probe_ssh()
+        self._check_tokens()
+        self._ops = [op for op in self._ops if not op.future.done()]
+
+    def _send_requests(self):
+        for op in self._with_state(Operation.NEW):
+            try:
+                op.token.check()
+                op.jobid = op.request()['jobid']
+                op.state = Operation.SUBMITTED
+            except Exception as e:
+                self._finish(op, exception=e)
+
+    def _check_jobs(self):
+        ops = self._with_state(Operation.SUBMITTED)
+        if not ops:
+            return
+        jobs = self._cs.get_jobs()
+        for op in ops:
+            job = jobs.get(op.jobid, {})
+            if job.get('jobstatus') == 1:
+                op.state = Operation.JOB_DONE
+            elif job.get('jobstatus') == 2:
+                msg = '{} job {} failed: {}'.format(
+                    op.vm, op.jobid,
+                    job.get('jobresult', {}).get('errortext'))
+                self._finish(op, exception=JobFailed(msg))
+
+    def _check_states(self):
+        states = self._cs._monitor.get_states()
+        for op in self._with_state(Operation.JOB_DONE):
+            if states.get(op.vm) == Operation.RUNNING:
+                op.state = Operation.RUNNING
+
+    def _probe_ssh(self):
+        ops = self._with_state(Operation.RUNNING)
+        if not ops:
+            return
+        if self._probe_pool is None:
+            self._probe_pool = ThreadPoolExecutor(self.probes)
+        probe = self._cs._probe
+        for op in ops:
+            if op.probe is None:
+                op.probe = self._probe_pool.submit(probe.is_available, op.vm)
+        wait([op.probe for op in ops], timeout=self.probe_wait)
+        for op in ops:
+            if op.probe.done():
+                available = op.probe.exception() is None and \
+                    op.probe.result()
+                op.probe = None
+                if available:
+                    op.state = Operation.SSH_READY
+                    self._finish(op, result=op.vm)
+
+    def _stop_probes(self):
+        if self._probe_pool is not None:
+            self._probe_pool.shutdown(wait=False)
+            self._probe_pool = None
+
+    def _check_tokens(self):
+        for op in self._ops:
+            if not op.future.done():
+                try:
+                    op.token.check()
+                except Exception as e:
+                    self._finish(op, exception=e)
+
+    def _with_state(self, state):
+        return [op for op in self._ops
+                if op.state == state and not op.future.done()]
+
+    def _finish(self, op, result=None, exception=None):
+        if op.probe is not None:
+            op.probe.cancel()  # if it has not started yet
+        if exception is None:
+            op.future.set_result(result)
+        else:
+            if not isinstance(exception, Cancelled):
+                self._cs._logger.failure(op.title, exception)
+            op.future.set_exception(exception)
+        self._cs._release_monitor()
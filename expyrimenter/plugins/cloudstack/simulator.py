@@ -0,0 +1,455 @@
+"""In-memory CloudStack backend running on a virtual clock.
+
+Example of a 1,000-VM scenario that runs in seconds::
+
+    clock = VirtualClock()
+    api = SimulatedAPI(clock, seed=42, failure_rate=0.01)
+    names = ['vm{}'.format(i) for i in range(1000)]
+    for name in names:
+        api.add_vm(name)
+    cs = CloudStack(api=api, clock=clock, ssh=api.ssh, probe=api.ssh,
+                    monitor=StateMonitorThread(api, clock), scheduler=True)
+    Pool(names, cloudstack=cs, start_times=StartTimes(path=False)).get(1000)
+    print(clock.time())  # virtual seconds spent
+
+With the same seed, every VM gets the same durations regardless of the
+order of API calls. Results are reproducible as long as the threads that
+drive the scenario are registered with the clock (see
+:meth:`VirtualClock.running`), as the scheduler, bulk operation and state
+monitor threads are. Without ``scheduler=True``, VMs are started by executor
+tasks, which are not registered, so results depend on machine load, and
+each booting VM holds a thread.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import math
+import random
+import threading
+from time import monotonic
+
+
+class SimulatedAPIError(Exception):
+    """Raised where the real API would answer with an HTTP error."""
+    def __init__(self, errorcode, errortext):
+        super().__init__('{}: {}'.format(errorcode, errortext))
+        self.errorcode = errorcode
+        self.errortext = errortext
+
+
+class VirtualClock:
+    """Discrete-event clock with the same interface as the time module.
+
+    Virtual time only moves when threads call :meth:`sleep`: the sleeper with
+    the earliest deadline wakes up after every event scheduled up to that
+    deadline has fired. Computation between sleeps takes no virtual time.
+
+    Time does not advance while a thread registered by :meth:`running` is
+    doing anything but sleeping. For other threads, time is only advanced
+    after *settle* real seconds without any activity (a sleep, a wake-up or
+    :meth:`touch`), which depends on machine load.
+    """
+    def __init__(self, start=0.0, settle=0.001):
+        """
+        :param float settle: real seconds of quiescence before time is
+            advanced.
+        """
+        self._now = start
+        self._settle = settle
+        self._activity = monotonic()
+        self._events = []  # heap of (time, seq, callback, args)
+        self._sleepers = []  # heap of _Sleeper
+        self._seq = itertools.count()
+        self._running = 0  # registered threads that are not sleeping
+        self._ranks = itertools.count()  # registration order
+        self._local = threading.local()
+        self.lock = threading.RLock()
+
+    def time(self):
+        with self.lock:
+            return self._now
+
+    def schedule(self, delay, callback, *args):
+        """Call ``callback(*args)`` after *delay* virtual seconds."""
+        with self.lock:
+            event = (self._now + max(delay, 0), next(self._seq), callback,
+                     args)
+            heapq.heappush(self._events, event)
+
+    def advance(self, seconds):
+        """Move time forward, e.g. from a single-threaded driver."""
+        with self.lock:
+            self._advance_to(self._now + seconds)
+            self._wake_until(self._now)
+
+    def touch(self):
+        """Signal activity, postponing the next advance of time."""
+        with self.lock:
+            self._activity = monotonic()
+
+    @contextmanager
+    def running(self):
+        """Register the current thread, so that time waits for it."""
+        if getattr(self._local, 'registered', False):
+            yield
+            return
+        with self.lock:
+            self._running += 1
+            rank = next(self._ranks)
+        with self._registered(rank):
+            yield
+
+    def thread(self, target, *args):
+        """Daemon thread that is registered since its creation, so that time
+        does not advance before it runs.
+        """
+        with self.lock:
+            self._running += 1
+            rank = next(self._ranks)
+
+        def run():
+            with self._registered(rank):
+                target(*args)
+
+        return threading.Thread(target=run, daemon=True)
+
+    @contextmanager
+    def _registered(self, rank):
+        """The current thread is already counted as running."""
+        self._local.registered = True
+        self._local.rank = rank
+        try:
+            yield
+        finally:
+            with self.lock:
+                self._local.registered = False
+                self._running -= 1
+                self._notify_first()
+
+    def sleep(self, seconds):
+        with self.lock:
+            self._activity = monotonic()
+            registered = getattr(self._local, 'registered', False)
+            rank = self._local.rank if registered else math.inf
+            me = _Sleeper(self._now + max(seconds, 0), rank, next(self._seq),
+                          self.lock, registered)
+            if me.registered:
+                self._running -= 1
+            # The first one may be no longer the first or able to advance
+            self._notify_first()
+            heapq.heappush(self._sleepers, me)
+            while not me.awake:
+                if self._sleepers[0] is not me or self._running:
+                    me.cond.wait()
+                else:
+                    quiet = monotonic() - self._activity
+                    if quiet < self._settle:
+                        me.cond.wait(self._settle - quiet)
+                    elif self._sleepers[0] is me and not self._running:
+                        self._advance_to(me.deadline)
+                        self._wake_until(me.deadline)
+
+    def _advance_to(self, deadline):
+        while self._events and self._events[0][0] <= deadline:
+            when, _, callback, args = heapq.heappop(self._events)
+            self._now = max(self._now, when)
+            callback(*args)
+        self._now = max(self._now, deadline)
+
+    def _wake_until(self, deadline):
+        """Wake up sleepers due by *deadline* and the next one in line.
+
+        Only one registered sleeper is woken up and it counts as running from
+        now on, so that registered threads due at the same time run one at a
+        time, in the order they were registered.
+        """
+        while self._sleepers and self._sleepers[0].deadline <= deadline:
+            sleeper = heapq.heappop(self._sleepers)
+            sleeper.awake = True
+            sleeper.cond.notify()
+            if sleeper.registered:
+                self._running += 1
+                break
+        self._activity = monotonic()
+        self._notify_first()
+
+    def _notify_first(self):
+        if self._sleepers:
+            self._sleepers[0].cond.notify()
+
+
+class _Sleeper:
+    def __init__(self, deadline, rank, seq, lock, registered=False):
+        """:param rank: registration order, or infinity if not registered."""
+        self.deadline = deadline
+        self.rank = rank
+        self.seq = seq
+        self.registered = registered
+        self.awake = False
+        self.cond = threading.Condition(lock)
+
+    def __lt__(self, other):
+        return (self.deadline, self.rank, self.seq) < \
+            (other.deadline, other.rank, other.seq)
+
+
+def lognormal(median, sigma):
+    """Duration distribution for :class:`SimulatedAPI` parameters."""
+    mu = math.log(median)
+    return lambda rng, vm: rng.lognormvariate(mu, sigma)
+
+
+def uniform(low, high):
+    """Duration distribution for :class:`SimulatedAPI` parameters."""
+    return lambda rng, vm: rng.uniform(low, high)
+
+
+class SimulatedAPI:
+    """Fake :class:`API` modelling VM state machines and async jobs.
+
+    Only the commands used by this plugin are implemented. Durations are
+    callables receiving a :class:`random.Random` and the VM dict, so that they
+    may depend on, e.g., ``vm['hostname']``. Each VM has its own random
+    stream derived from *seed* and its name.
+    """
+    def __init__(self, clock=None, seed=None, hosts=None, boot_time=None,
+                 ssh_delay=None, stop_time=None, failure_rate=0.0):
+        self.clock = VirtualClock() if clock is None else clock
+        self.hosts = ['host{}'.format(i) for i in range(1, 9)] \
+            if hosts is None else hosts
+        self.boot_time = lognormal(60, 0.3) if boot_time is None \
+            else boot_time
+        self.ssh_delay = uniform(5, 20) if ssh_delay is None else ssh_delay
+        self.stop_time = uniform(5, 15) if stop_time is None else stop_time
+        self.failure_rate = failure_rate
+        self.calls = Counter()  # command: number of calls
+        self._seed = seed
+        self._rngs = {}  # id: random.Random
+        self._ids = itertools.count(1)
+        self._vms = {}  # id: VM dict as returned by listVirtualMachines
+        self._names = {}  # name: id
+        self._ssh_ready = {}  # id: virtual time when SSH becomes available
+        self._jobs = {}  # jobid: queryAsyncJobResult response
+        self._events = []  # listEvents items, oldest first
+        self._lock = self.clock.lock
+
+    @property
+    def ssh(self):
+        """Replacement for the SSH class, see :class:`SimulatedSSH`."""
+        return SimulatedSSH(self)
+
+    def add_vm(self, name, state='Stopped', **attrs):
+        """Create a VM without going through deployVirtualMachine."""
+        with self._lock:
+            vm = self._new_vm(name, attrs)
+            vm['state'] = state
+            if state == 'Running':
+                self._ssh_ready[vm['id']] = self.clock.time()
+            return vm['id']
+
+    def is_ssh_ready(self, name):
+        with self._lock:
+            vm_id = self._names.get(name)
+            if vm_id is None or self._vms[vm_id]['state'] != 'Running':
+                return False
+            return self._ssh_ready[vm_id] <= self.clock.time()
+
+    # CloudStack commands
+
+    def listVirtualMachines(self, **kwargs):
+        with self._lock:
+            self.calls['listVirtualMachines'] += 1
+            self.clock.touch()
+            vms = [dict(vm) for vm in self._vms.values()
+                   if self._matches(vm, kwargs)]
+        # Like the real API, the list key is missing when there are no VMs
+        if not vms:
+            return {}
+        return {'count': len(vms), 'virtualmachine': vms}
+
+    def startVirtualMachine(self, id, **kwargs):
+        with self._lock:
+            self.calls['startVirtualMachine'] += 1
+            self.clock.touch()
+            vm = self._get_vm(id)
+            if vm['state'] == 'Running':
+                return self._new_job(vm, status=1)
+            if vm['state'] != 'Stopped':
+                self._state_error(vm)
+            vm['state'] = 'Starting'
+            self._new_event(vm, 'VM.START', 'Started')
+            job = self._new_job(vm)
+            self._schedule(self.boot_time, self._boot_done, vm, job, 'Stopped')
+            return job
+
+    def stopVirtualMachine(self, id, **kwargs):
+        with self._lock:
+            self.calls['stopVirtualMachine'] += 1
+            self.clock.touch()
+            vm = self._get_vm(id)
+            if vm['state'] == 'Stopped':
+                return self._new_job(vm, status=1)
+            if vm['state'] != 'Running':
+                self._state_error(vm)
+            vm['state'] = 'Stopping'
+            self._new_event(vm, 'VM.STOP', 'Started')
+            job = self._new_job(vm)
+            self._schedule(self.stop_time, self._stop_done, vm, job)
+            return job
+
+    def deployVirtualMachine(self, **kwargs):
+        with self._lock:
+            self.calls['deployVirtualMachine'] += 1
+            self.clock.touch()
+            name = kwargs.pop('name', None)
+            if name is None:
+                name = 'VM-{}'.format(len(self._vms) + 1)
+            if name in self._names:
+                raise SimulatedAPIError(431, 'Unable to deploy vm, vm with '
+                                        'name {} already exists'.format(name))
+            vm = self._new_vm(name, kwargs)
+            vm['state'] = 'Starting'
+            self._new_event(vm, 'VM.CREATE', 'Completed')
+            self._new_event(vm, 'VM.START', 'Started')
+            job = self._new_job(vm)
+            self._schedule(self.boot_time, self._boot_done, vm, job, 'Error')
+            return job
+
+    def listEvents(self, startdate=None, page=None, pagesize=None, **kwargs):
+        """Newest events first. Dates are 'yyyy-MM-dd HH:mm:ss'."""
+        if pagesize is not None and page is None:
+            raise SimulatedAPIError(431, '"page" parameter is required when '
+                                    '"pagesize" is specified')
+        page, pagesize = page or 1, pagesize or 500
+        with self._lock:
+            self.calls['listEvents'] += 1
+            self.clock.touch()
+            events = [dict(e) for e in reversed(self._events)
+                      if startdate is None or
+                      e['created'][:19].replace('T', ' ') >= startdate]
+        if 'type' in kwargs:
+            events = [e for e in events if e['type'] == kwargs['type']]
+        count = len(events)
+        begin = (int(page) - 1) * int(pagesize)
+        events = events[begin:begin + int(pagesize)]
+        if not events:
+            return {}
+        return {'count': count, 'event': events}
+
+    def listAsyncJobs(self, **kwargs):
+        with self._lock:
+            self.calls['listAsyncJobs'] += 1
+            self.clock.touch()
+            jobs = [dict(job) for job in self._jobs.values()]
+        if not jobs:
+            return {}
+        return {'count': len(jobs), 'asyncjobs': jobs}
+
+    def queryAsyncJobResult(self, jobid, **kwargs):
+        with self._lock:
+            self.calls['queryAsyncJobResult'] += 1
+            self.clock.touch()
+            if jobid not in self._jobs:
+                raise SimulatedAPIError(431, 'Unable to find job ' + jobid)
+            return dict(self._jobs[jobid])
+
+    # Internal state machine
+
+    def _new_vm(self, name, attrs):
+        vm_id = 'sim-{}'.format(next(self._ids))
+        vm = {'id': vm_id, 'name': name, 'displayname': name,
+              'serviceofferingid': 'sim-offering',
+              'templateid': 'sim-template', 'zoneid': 'sim-zone'}
+        vm.update(attrs)
+        seed = None if self._seed is None else '{}/{}'.format(self._seed, name)
+        self._rngs[vm_id] = random.Random(seed)
+        self._assign_host(vm)
+        self._vms[vm_id] = vm
+        self._names[name] = vm_id
+        return vm
+
+    def _assign_host(self, vm):
+        if 'hostname' not in vm:
+            vm['hostname'] = self.hosts[len(self._vms) % len(self.hosts)]
+        vm.setdefault('hostid', 'sim-' + vm['hostname'])
+
+    def _new_job(self, vm, status=0):
+        jobid = 'sim-job-{}'.format(next(self._ids))
+        self._jobs[jobid] = {'jobid': jobid, 'jobstatus': status,
+                             'jobresult': {}}
+        if status:
+            self._jobs[jobid]['jobresult'] = {'virtualmachine': dict(vm)}
+        return {'id': vm['id'], 'jobid': jobid}
+
+    def _new_event(self, vm, event_type, state, level='INFO'):
+        created = datetime(2015, 1, 1) + timedelta(seconds=self.clock.time())
+        self._events.append({
+            'id': 'sim-event-{}'.format(next(self._ids)), 'type': event_type,
+            'state': state, 'level': level,
+            'created': created.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+            'resourceid': vm['id'], 'resourcetype': 'VirtualMachine'})
+
+    def _finish_job(self, job, vm, success):
+        result = self._jobs[job['jobid']]
+        if success:
+            result['jobstatus'] = 1
+            result['jobresult'] = {'virtualmachine': dict(vm)}
+        else:
+            result['jobstatus'] = 2
+            result['jobresult'] = {'errorcode': 530,
+                                   'errortext': 'Simulated failure'}
+
+    def _schedule(self, duration, callback, *args):
+        vm = args[0]
+        self.clock.schedule(duration(self._rngs[vm['id']], vm), callback,
+                            *args)
+
+    def _boot_done(self, vm, job, fail_state):
+        rng = self._rngs[vm['id']]
+        if rng.random() < self.failure_rate:
+            vm['state'] = fail_state
+            self._new_event(vm, 'VM.START', 'Completed', 'ERROR')
+            self._finish_job(job, vm, False)
+        else:
+            vm['state'] = 'Running'
+            self._new_event(vm, 'VM.START', 'Completed')
+            delay = self.ssh_delay(rng, vm)
+            self._ssh_ready[vm['id']] = self.clock.time() + delay
+            self._finish_job(job, vm, True)
+
+    def _stop_done(self, vm, job):
+        vm['state'] = 'Stopped'
+        self._new_event(vm, 'VM.STOP', 'Completed')
+        self._finish_job(job, vm, True)
+
+    def _get_vm(self, vm_id):
+        if vm_id not in self._vms:
+            raise SimulatedAPIError(431, 'Unable to find VM ' + vm_id)
+        return self._vms[vm_id]
+
+    @staticmethod
+    def _state_error(vm):
+        raise SimulatedAPIError(431, 'VM {} is in {} state'.format(
+            vm['name'], vm['state']))
+
+    @staticmethod
+    def _matches(vm, filters):
+        for key in 'id', 'name', 'state', 'hostid', 'zoneid':
+            if key in filters and vm.get(key) != filters[key]:
+                return False
+        return True
+
+
+class SimulatedSSH:
+    """Stands in for the SSH class when VMs are simulated."""
+    def __init__(self, api):
+        self._api = api
+
+    def is_available(self, host):
+        return self._api.is_ssh_ready(host)
+
+    def await_availability(self, host, interval=10):
+        while not self.is_available(host):
+            self._api.clock.sleep(interval)
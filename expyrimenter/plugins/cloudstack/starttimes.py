@@ -0,0 +1,140 @@
+from expyrimenter.core import ExpyLogger
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from statistics import median
+
+
+class StartTimes:
+    """Persistent history of start-to-SSH-ready durations per VM.
+
+    The JSON file maps VM names to their last durations (seconds) and the
+    host they last ran on. It may be shared by processes: :meth:`save` merges
+    the new records into the file under a file lock.
+    """
+    DEFAULT_PATH = '~/.expyrimenter/cloudstack_start_times.json'
+
+    def __init__(self, path=None, history=10):
+        """
+        :param str path: JSON file. If ``False``, nothing is persisted.
+        :param int history: number of durations kept for each VM.
+        """
+        if path is None:
+            path = StartTimes.DEFAULT_PATH
+        self.path = os.path.expanduser(path) if path else None
+        self.history = history
+        self._logger = ExpyLogger.getLogger('cloudstack.starttimes')
+        self._lock = threading.Lock()
+        self._vms = self._load()  # name: {'durations': [], 'host': str}
+        self._new = {}  # same as _vms, but only what is not saved yet
+
+    def record(self, vm, duration):
+        with self._lock:
+            for vms in self._vms, self._new:
+                durations = self._vm(vms, vm)['durations']
+                durations.append(duration)
+                del durations[:-self.history]
+
+    def record_at_least(self, vm, duration):
+        """Record a start that was not waited for after *duration*, if that
+        is longer than the current estimate, which would be lowered
+        otherwise.
+        """
+        estimate = self.estimate(vm)
+        if estimate is None or duration > estimate:
+            self.record(vm, duration)
+
+    def set_host(self, vm, host):
+        with self._lock:
+            for vms in self._vms, self._new:
+                self._vm(vms, vm)['host'] = host
+
+    def estimate(self, vm):
+        """Median of recorded durations or None if there is no record."""
+        with self._lock:
+            durations = self._vms.get(vm, {}).get('durations')
+            return median(durations) if durations else None
+
+    def host(self, vm):
+        with self._lock:
+            return self._vms.get(vm, {}).get('host')
+
+    def rank(self, vms):
+        """Sort *vms* so that the fastest ones come first while alternating
+        among their last known hosts.
+
+        VMs without history get the median of the known estimates and those
+        with unknown host are considered to be alone in their hosts.
+        """
+        estimates = {vm: self.estimate(vm) for vm in vms}
+        known = [e for e in estimates.values() if e is not None]
+        default = median(known) if known else 0
+        for vm, estimate in estimates.items():
+            if estimate is None:
+                estimates[vm] = default
+
+        by_speed = sorted(vms, key=estimates.get)
+        host_rank = {}  # vm: position among VMs of the same host
+        host_count = {}
+        for vm in by_speed:
+            host = self.host(vm) or ('unknown', vm)
+            host_rank[vm] = host_count.get(host, 0)
+            host_count[host] = host_rank[vm] + 1
+
+        return sorted(by_speed, key=lambda vm: host_rank[vm])
+
+    def save(self):
+        """Merge records since the last save with the ones in the file."""
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with self._file_lock(), self._lock:
+            vms = self._load()
+            for vm, new in self._new.items():
+                record = self._vm(vms, vm)
+                record['durations'] += new['durations']
+                del record['durations'][:-self.history]
+                if new['host'] is not None:
+                    record['host'] = new['host']
+            self._write(json.dumps(vms, sort_keys=True, indent=1), directory)
+            self._vms, self._new = vms, {}
+
+    def _write(self, data, directory):
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    @contextmanager
+    def _file_lock(self):
+        """Serializes saves of all processes."""
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def _vm(vms, vm):
+        return vms.setdefault(vm, {'durations': [], 'host': None})
+
+    def _load(self):
+        """A corrupt file is logged and ignored."""
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                vms = json.load(f)
+            if not isinstance(vms, dict):
+                raise ValueError('not a JSON object')
+        except (OSError, ValueError) as e:
+            self._logger.error('ignoring start times in {}: {}'.format(
+                self.path, e))
+            return {}
+        return vms
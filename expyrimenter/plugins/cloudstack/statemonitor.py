@@ -1,17 +1,39 @@
 from .api import API
+from .profiling import Profiler
+from .tasks import clock_thread
 from multiprocessing import Manager, Process
-from time import sleep
 import signal
+import time
 from expyrimenter.core import ExpyLogger
 
 
 class StateMonitor:
+    """In incremental mode, only VMs with new VM.START, VM.STOP or VM.CREATE
+    events are updated and the full VM list is fetched every *full_every*
+    rounds or when events are not enough. If events do not identify VMs,
+    which depends on the CloudStack version, the monitor falls back to
+    non-incremental mode.
+    """
     _stop = False
-
-    def __init__(self, states_proxy):
+    EVENT_TYPES = ('VM.START', 'VM.STOP', 'VM.CREATE')
+    EVENT_STATES = {('VM.START', 'Started'): 'Starting',
+                    ('VM.START', 'Completed'): 'Running',
+                    ('VM.STOP', 'Started'): 'Stopping',
+                    ('VM.STOP', 'Completed'): 'Stopped'}
+
+    def __init__(self, states_proxy, api=None, clock=None, incremental=False,
+                 full_every=12):
         self._states_proxy = states_proxy
         self._local_states = {}
-        self._api = API()
+        self._api = API() if api is None else api
+        self._clock = time if clock is None else clock
+        self._incremental = incremental
+        self._full_every = full_every
+        self._rounds = 0
+        self._names = {}  # VM id: name
+        # Events are fetched since _mark, but those in _mark_ids were seen
+        self._mark = None
+        self._mark_ids = set()
         self._logger = ExpyLogger.getLogger('cloudstack.statemonitor')
         self.title = '{} {}'.format(type(self).__name__, id(self))
         self._logger.start(self.title)
@@ -19,9 +41,12 @@ class StateMonitor:
     def monitor_states(self, interval=None):
         if interval is None:
             interval = 5
-        while not StateMonitor._stop:
-            self._monitor_states_once()
-            sleep(interval)
+        while not self._stop:
+            with Profiler.profile('monitor round'):
+                self._monitor_states_once()
+            self._clock.sleep(interval)
+        # Monitor processes are terminated without running atexit
+        Profiler.dump()
         self._logger.end(self.title, level=ExpyLogger.INFO)
 
     @classmethod
@@ -30,9 +55,74 @@ class StateMonitor:
         cls._stop = True
 
     def _monitor_states_once(self):
-        vms = self._api.listVirtualMachines()['virtualmachine']
-        for vm in vms:
-            self._update_state(vm['name'], vm['state'])
+        full = not self._incremental or \
+            self._rounds % self._full_every == 0 or not self._sync_events()
+        if full:
+            if self._incremental:
+                self._init_mark()
+            vms = self._api.listVirtualMachines()['virtualmachine']
+            for vm in vms:
+                self._update_vm(vm)
+        self._rounds += 1
+
+    def _update_vm(self, vm):
+        self._names[vm['id']] = vm['name']
+        self._update_state(vm['name'], vm['state'])
+
+    def _init_mark(self):
+        """Events are listed from the newest one."""
+        events = self._api.listEvents(page=1, pagesize=1).get('event', [])
+        if events:
+            self._advance_mark(events)
+        else:
+            self._mark, self._mark_ids = '1970-01-01 00:00:00', set()
+
+    def _sync_events(self):
+        """:returns: False if a full list is needed."""
+        if self._mark is None:
+            return False
+        response = self._api.listEvents(startdate=self._mark)
+        events = [e for e in response.get('event', [])
+                  if e['id'] not in self._mark_ids]
+        if response.get('count', 0) > len(response.get('event', [])):
+            return False  # more than one page
+        # Same-second events have random ids, but Started comes first
+        events.sort(key=lambda e: (e['created'], e['state'] != 'Started'))
+
+        reconcile = set()  # VM ids whose state is not known from events
+        for event in events:
+            if event['type'] not in StateMonitor.EVENT_TYPES:
+                continue
+            vm_id = event.get('resourceid')
+            if vm_id is None:
+                self._logger.warning('events have no resourceid, disabling '
+                                     'incremental mode')
+                self._incremental = False
+                return False
+            state = StateMonitor.EVENT_STATES.get((event['type'],
+                                                   event['state']))
+            if vm_id in self._names and state is not None and \
+                    event.get('level') != 'ERROR':
+                self._update_state(self._names[vm_id], state)
+            else:
+                reconcile.add(vm_id)
+        if events:
+            self._advance_mark(events)
+
+        for vm_id in reconcile:
+            for vm in self._api.listVirtualMachines(id=vm_id).get(
+                    'virtualmachine', []):
+                self._update_vm(vm)
+        return True
+
+    def _advance_mark(self, events):
+        stamps = [e['created'][:19].replace('T', ' ') for e in events]
+        mark = max(stamps)
+        ids = {e['id'] for e, stamp in zip(events, stamps) if stamp == mark}
+        if mark == self._mark:
+            self._mark_ids |= ids
+        else:
+            self._mark, self._mark_ids = mark, ids
 
     def _update_state(self, k, v):
         if v != self._local_states.get(k):
@@ -44,8 +134,8 @@ class StateMonitor:
         StateMonitor.stop()
 
     @staticmethod
-    def state_monitor_proc(states, interval):
-        sm = StateMonitor(states)
+    def state_monitor_proc(states, interval, options):
+        sm = StateMonitor(states, **options)
         sm.monitor_states(interval)
 
 
@@ -55,6 +145,8 @@ signal.signal(signal.SIGTERM, StateMonitor.handler)
 # Ensures only one state monitor is running at most
 class StateMonitorProcess:
     _mgr = _states = _process = None
+    # StateMonitor keyword arguments, e.g. {'incremental': True}
+    options = {}
 
     @classmethod
     def start(cls, interval=None):
@@ -63,7 +155,8 @@ class StateMonitorProcess:
             cls._mgr = Manager()
             cls._states = cls._mgr.dict()
             cls._process = Process(target=StateMonitor.state_monitor_proc,
-                                   args=(cls._states, interval))
+                                   args=(cls._states, interval,
+                                         cls.options))
             cls._process.start()
 
     @classmethod
@@ -78,3 +171,37 @@ class StateMonitorProcess:
     @classmethod
     def get_states(cls):
         return cls._states
+
+
+class StateMonitorThread:
+    """Same interface as StateMonitorProcess, but monitors in a thread of the
+    current process. Useful for APIs that cannot be shared with another
+    process, like the simulated one.
+    """
+    def __init__(self, api=None, clock=None, **options):
+        """:param options: StateMonitor keyword arguments."""
+        self._api = api
+        self._clock = clock
+        self._options = options
+        self._states = self._thread = self._monitor = None
+
+    def start(self, interval=None):
+        if self._thread is None:
+            self._states = {}
+            self._monitor = StateMonitor(self._states, self._api, self._clock,
+                                         **self._options)
+            self._thread = clock_thread(self._clock,
+                                        self._monitor.monitor_states, interval)
+            self._thread.start()
+
+    def stop(self):
+        """The thread is not joined, as it may be sleeping on a virtual clock
+        that waits for the caller. It exits when it wakes up.
+        """
+        if self._thread is not None:
+            self._monitor._stop = True
+            self._states.clear()
+            self._states = self._thread = self._monitor = None
+
+    def get_states(self):
+        return self._states
@@ -0,0 +1,149 @@
+from contextlib import nullcontext
+import socket
+import subprocess
+import threading
+import time
+
+
+class Cancelled(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CancelToken:
+    """Cooperative cancellation and deadline for a waiting task.
+
+    Waiting code calls :meth:`sleep` instead of ``clock.sleep`` and stops with
+    :class:`Cancelled` or :class:`DeadlineExceeded`.
+    """
+    def __init__(self, clock=None, deadline=None):
+        """
+        :param clock: provides ``time()`` and ``sleep(seconds)``.
+        :param float deadline: seconds from now or None for no deadline.
+        """
+        self._clock = time if clock is None else clock
+        self.expires = None if deadline is None \
+            else self._clock.time() + deadline
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds until the deadline or None if there is none."""
+        if self.expires is None:
+            return None
+        return self.expires - self._clock.time()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded()
+
+    def sleep(self, seconds):
+        """Sleep until *seconds* pass, the deadline or cancellation."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        if self._clock is time:
+            self._event.wait(seconds)  # cancel() wakes us up
+        else:
+            self._clock.sleep(seconds)
+        self.check()
+
+
+def clock_running(clock):
+    """Context manager that registers the current thread with clocks that
+    keep track of running threads, like VirtualClock.
+    """
+    running = getattr(clock, 'running', None)
+    return nullcontext() if running is None else running()
+
+
+def clock_thread(clock, target, *args):
+    """Daemon thread that is waited for by clocks that keep track of running
+    threads, like VirtualClock.
+    """
+    thread = getattr(clock, 'thread', None)
+    if thread is None:
+        return threading.Thread(target=target, args=args, daemon=True)
+    return thread(target, *args)
+
+
+class TaskHandle:
+    """Future of a lifecycle task that can be cancelled while running."""
+    def __init__(self, future, token, on_cancel=None):
+        """:param on_cancel: called without arguments by :meth:`cancel`."""
+        self.future = future
+        self.token = token
+        self._on_cancel = on_cancel
+
+    def cancel(self):
+        """Stop waiting. The VM operation itself is not reverted."""
+        self.token.cancel()
+        self.future.cancel()
+        if self._on_cancel is not None:
+            self._on_cancel()
+
+    def cancelled(self):
+        return self.token.cancelled
+
+    def done(self):
+        return self.future.done()
+
+    def succeeded(self):
+        """Whether the task finished without exception."""
+        return self.future.done() and not self.future.cancelled() and \
+            self.future.exception() is None
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def add_done_callback(self, fn):
+        """*fn* receives this handle."""
+        self.future.add_done_callback(lambda future: fn(self))
+
+
+class SSHProbe:
+    """Non-blocking check of whether SSH is available, with ``ssh <host>
+    exit`` like SSH.await_availability, so ssh_config applies (aliases,
+    Port, ProxyJump, user@host). Each check gives up after *timeout*
+    seconds.
+    """
+    def __init__(self, timeout=10, port=None):
+        """:param int port: if given, a login is only tried when the port
+            accepts connections, which is cheaper. Only for hosts reached
+            directly on that port.
+        """
+        self.timeout = timeout
+        self.port = port
+
+    def is_available(self, host):
+        if self.port is not None and not self._accepts(host):
+            return False
+        cmd = ['ssh', '-o', 'BatchMode=yes',
+               '-o', 'ConnectTimeout={}'.format(self.timeout), host, 'exit']
+        try:
+            return subprocess.call(cmd, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL,
+                                   timeout=2 * self.timeout) == 0
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+
+    def _accepts(self, host):
+        try:
+            with socket.create_connection((host, self.port), self.timeout):
+                return True
+        except OSError:
+            return False
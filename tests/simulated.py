@@ -0,0 +1,26 @@
+"""Test case base for tests that run on the simulated CloudStack."""
+import unittest
+from expyrimenter.plugins.cloudstack import CloudStack
+from expyrimenter.plugins.cloudstack.simulator import SimulatedAPI
+from expyrimenter.plugins.cloudstack.statemonitor import StateMonitorThread
+
+
+class SimulatedTestCase(unittest.TestCase):
+    def simulate(self, stopped=(), running=(), scheduler=True, **kwargs):
+        """Set self.api with *running* and *stopped* VMs, self.clock and
+        self.cs using them with a state monitor thread.
+
+        :param kwargs: SimulatedAPI arguments other than the seed.
+        """
+        self.api = SimulatedAPI(seed=1, **kwargs)
+        self.clock = self.api.clock
+        for name in running:
+            self.api.add_vm(name, state='Running')
+        for name in stopped:
+            self.api.add_vm(name)
+        # VM ids are cached by name for all CloudStack objects
+        CloudStack._id_cache = None
+        self.addCleanup(setattr, CloudStack, '_id_cache', None)
+        self.cs = CloudStack(api=self.api, clock=self.clock, ssh=self.api.ssh,
+                             probe=self.api.ssh, scheduler=scheduler,
+                             monitor=StateMonitorThread(self.api, self.clock))
@@ -0,0 +1,44 @@
+import unittest
+from expyrimenter.plugins.cloudstack.simulator import uniform
+from expyrimenter.plugins.cloudstack.tasks import DeadlineExceeded
+from simulated import SimulatedTestCase
+
+
+class TestBulkOperation(SimulatedTestCase):
+    def setUp(self):
+        self.names = ['vm{}'.format(i) for i in range(5)]
+        self.simulate(self.names, ['running'], boot_time=uniform(60, 60),
+                      stop_time=uniform(5, 5))
+
+    def test_start_many(self):
+        results = self.cs.start_many(self.names + ['running'],
+                                     concurrency=2).result(10)
+        self.assertTrue(all(r.success for r in results.values()))
+        self.assertEqual(0, results['running'].duration)
+        self.assertGreaterEqual(results['vm0'].duration, 60)
+        self.assertEqual(5, self.api.calls['startVirtualMachine'])
+
+    def test_concurrency_is_bounded(self):
+        self.cs.start_many(self.names, concurrency=2).result(10)
+        # 3 rounds of at most 2 VMs booting for 60 seconds each
+        self.assertGreaterEqual(self.api.clock.time(), 180)
+
+    def test_failures_are_reported(self):
+        self.api.failure_rate = 1
+        results = self.cs.start_many(['vm0', 'none']).result(10)
+        self.assertFalse(results['vm0'].success)
+        self.assertFalse(results['none'].success)
+
+    def test_deadline(self):
+        results = self.cs.start_many(self.names, deadline=30).result(10)
+        for result in results.values():
+            self.assertIsInstance(result.error, DeadlineExceeded)
+
+    def test_stop_many(self):
+        results = self.cs.stop_many(['running', 'vm0']).result(10)
+        self.assertTrue(all(r.success for r in results.values()))
+        self.assertEqual(1, self.api.calls['stopVirtualMachine'])
+
+
+if __name__ == '__main__':
+    unittest.main()
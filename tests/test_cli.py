@@ -0,0 +1,62 @@
+import unittest
+from expyrimenter.plugins.cloudstack.cli import main, percentile
+from expyrimenter.plugins.cloudstack.simulator import uniform
+from simulated import SimulatedTestCase
+from io import StringIO
+import json
+
+
+class TestCLI(SimulatedTestCase):
+    def setUp(self):
+        self.simulate(['vm1'], ['vm2'], boot_time=uniform(60, 60),
+                      ssh_delay=uniform(10, 10), stop_time=uniform(5, 5))
+
+    def _main(self, *argv):
+        out = StringIO()
+        status = main(list(argv), cloudstack=self.cs, out=out)
+        return status, [json.loads(line) for line in out.getvalue().split(
+            '\n') if line]
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertIsNone(percentile([], 50))
+
+    def test_status(self):
+        status, lines = self._main('status', '--format', 'ndjson')
+        self.assertEqual(0, status)
+        states = [line['state'] for line in lines[:-1]]
+        self.assertEqual(['Stopped', 'Running'], states)
+        self.assertEqual(2, lines[-1]['summary']['ok'])
+
+    def test_status_fails_without_api(self):
+        def unavailable(**kwargs):
+            raise OSError('connection refused')
+
+        self.api.listVirtualMachines = unavailable
+        status, lines = self._main('status', '--format', 'ndjson')
+        self.assertEqual(1, status)
+        self.assertEqual('connection refused', lines[0]['error'])
+        self.assertEqual(1, lines[-1]['summary']['failed'])
+
+    def test_start_and_stop(self):
+        status, lines = self._main('start', '--format', 'ndjson', 'vm1')
+        self.assertEqual(0, status)
+        self.assertEqual('ok', lines[0]['status'])
+        self.assertGreaterEqual(lines[0]['seconds'], 70)
+        self.assertEqual(1, lines[-1]['summary']['ok'])
+
+        status, lines = self._main('stop', '--format', 'ndjson', 'vm1', 'vm2')
+        self.assertEqual(0, status)
+        self.assertEqual(2, lines[-1]['summary']['ok'])
+
+    def test_missing_vm_fails(self):
+        status, lines = self._main('start', '--format', 'ndjson', 'none')
+        self.assertEqual(1, status)
+        self.assertEqual('failed', lines[0]['status'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from expyrimenter.plugins.cloudstack.leases import LeaseManager
+import os
+import tempfile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+
+class TestLeaseManager(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'leases.sqlite')
+        self.clock = FakeClock()
+        self.vms = ['vm1', 'vm2', 'vm3']
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _manager(self):
+        return LeaseManager(self.path, ttl=60, clock=self.clock)
+
+    def test_leases_are_exclusive(self):
+        first, second = self._manager(), self._manager()
+        self.assertEqual(['vm1', 'vm2'], first.acquire(self.vms, 2))
+        self.assertEqual(['vm3'], second.acquire(self.vms, 2))
+
+    def test_owner_keeps_its_leases(self):
+        manager = self._manager()
+        manager.acquire(self.vms, 1)
+        self.assertEqual(['vm1', 'vm2'], manager.acquire(self.vms, 2))
+
+    def test_own_leases_come_first(self):
+        manager = self._manager()
+        manager.acquire(['vm3'], 1)
+        self.assertEqual(['vm3', 'vm1'], manager.acquire(self.vms, 2))
+
+    def test_release(self):
+        first, second = self._manager(), self._manager()
+        first.acquire(self.vms, 3)
+        first.release(['vm2'])
+        self.assertEqual(['vm2'], second.acquire(self.vms, 3))
+
+    def test_expiration_and_renewal(self):
+        first, second = self._manager(), self._manager()
+        first.acquire(self.vms, 2)
+        self.clock.now = 50
+        first.renew(['vm1'])
+        self.clock.now = 100
+        self.assertEqual(['vm2', 'vm3'], second.acquire(self.vms, 3))
+        self.assertEqual({'vm2', 'vm3'}, first.leased_by_others())
+
+
+if __name__ == '__main__':
+    unittest.main()
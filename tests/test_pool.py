@@ -0,0 +1,148 @@
+import unittest
+from expyrimenter.plugins.cloudstack import Pool
+from expyrimenter.plugins.cloudstack.leases import LeaseManager
+from expyrimenter.plugins.cloudstack.simulator import SimulatedAPIError, \
+    uniform
+from expyrimenter.plugins.cloudstack.starttimes import StartTimes
+from simulated import SimulatedTestCase
+import asyncio
+import os
+import sqlite3
+import tempfile
+
+
+class TestPool(SimulatedTestCase):
+    def setUp(self):
+        stopped = ['vm{}'.format(i) for i in range(5)]
+        self.simulate(stopped, ['running'], boot_time=uniform(30, 90),
+                      ssh_delay=uniform(10, 10))
+        self.hostnames = ['running'] + stopped
+        self.pool = Pool(self.hostnames, cloudstack=self.cs,
+                         start_times=StartTimes(path=False))
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _leased_pool(self):
+        path = os.path.join(self.directory.name, 'leases.sqlite')
+        return Pool(self.hostnames, cloudstack=self.cs,
+                    start_times=StartTimes(path=False),
+                    leases=LeaseManager(path, clock=self.clock))
+
+    def test_get(self):
+        vms = self.pool.get(3)
+        self.assertEqual(3, len(vms))
+        self.assertEqual('running', vms[0])
+
+    def test_iter_ready_yields_running_first(self):
+        ready = self.pool.iter_ready(3)
+        self.assertEqual('running', next(ready))
+        self.assertEqual(2, len(list(ready)))
+
+    def test_aiter_ready(self):
+        async def collect():
+            return [vm async for vm in self.pool.aiter_ready(2)]
+
+        vms = asyncio.run(collect())
+        self.assertEqual('running', vms[0])
+        self.assertEqual(2, len(vms))
+
+    def test_failed_starts_are_replaced(self):
+        failing = {self.cs.get_id('vm0'), self.cs.get_id('vm1')}
+        start = self.api.startVirtualMachine
+
+        def start_or_fail(id, **kwargs):
+            if id in failing:
+                raise SimulatedAPIError(530, 'Simulated failure')
+            return start(id, **kwargs)
+
+        self.api.startVirtualMachine = start_or_fail
+        vms = self.pool.get(3)
+        self.assertEqual(['running', 'vm2', 'vm3'], sorted(vms))
+
+    def test_replacement_is_timed_from_its_start(self):
+        self.pool.hostnames = ['vm0', 'vm1']
+        self.api.boot_time = uniform(60, 60)
+        self.api.failure_rate = 1
+        start = self.api.startVirtualMachine
+
+        def fail_first(id, **kwargs):
+            if self.api.calls['startVirtualMachine']:
+                self.api.failure_rate = 0
+            return start(id, **kwargs)
+
+        self.api.startVirtualMachine = fail_first
+        vm, = self.pool.get(1)
+        self.assertGreater(self.clock.time(), 130)
+        self.assertLess(self.pool._start_times.estimate(vm), 90)
+
+    def test_failed_start_is_retried_once(self):
+        self.pool.hostnames = ['vm0']
+        self.api.failure_rate = 1
+        self.assertEqual([], self.pool.get(1))
+        self.assertEqual(2, self.api.calls['startVirtualMachine'])
+
+    def test_deadline(self):
+        self.assertEqual(['running'], self.pool.get(3, deadline=20))
+
+    def test_slow_spares_are_recorded(self):
+        fastest = self.pool.get(2, spare=3)[1]
+        estimate = self.pool._start_times.estimate
+        for vm in self.pool.last_started:
+            self.assertGreaterEqual(estimate(vm), estimate(fastest))
+
+    def test_aiter_ready_closed_early(self):
+        start_vms = self.pool._start_vms
+        started = {}
+
+        def capture(*args):
+            started.update(start_vms(*args))
+            return started
+
+        self.pool._start_vms = capture
+
+        async def first():
+            ready = self.pool.aiter_ready(5)
+            async for vm in ready:
+                break
+            await ready.aclose()
+            return vm
+
+        self.assertEqual('running', asyncio.run(first()))
+        self.assertEqual(4, len(started))
+        self.assertTrue(all(h.cancelled() for h in started.values()))
+
+    def test_stop(self):
+        self.pool.get(3)
+        results = self.pool.stop().result(10)
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(r.success for r in results.values()))
+        self.assertEqual([], self.pool.running_vms)
+
+    def test_wait_for_stop(self):
+        self.pool.stop()
+        self.pool.wait()
+        self.assertEqual(self.hostnames, self.pool.stopped_vms)
+
+    def test_wait_for_stop_that_cannot_release(self):
+        pool = self._leased_pool()
+
+        def release(vms=None):
+            raise sqlite3.OperationalError('database is locked')
+
+        pool._leases.release = release
+        pool.stop()
+        self.assertRaises(sqlite3.OperationalError, pool.wait)
+
+    def test_stopping_vms_stay_leased(self):
+        first, second = self._leased_pool(), self._leased_pool()
+        handle = first.stop()
+        self.assertEqual({'running'}, second._leases.leased_by_others())
+        self.assertNotIn('running', second.get(1))
+        handle.result(10)
+        self.assertEqual(set(), second._leases.leased_by_others())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from expyrimenter.plugins.cloudstack.profiling import Profiler
+import os
+import tempfile
+import threading
+import tracemalloc
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        Profiler._stats.clear()
+        Profiler._summary.clear()
+        Profiler.enable(self.dir.name, memory=True)
+
+    def tearDown(self):
+        Profiler.disable()
+        Profiler._stats.clear()
+        Profiler._summary.clear()
+        self.dir.cleanup()
+
+    def test_disabled_does_nothing(self):
+        Profiler.disable()
+        with Profiler.profile('listVirtualMachines'):
+            pass
+        self.assertEqual({}, Profiler._summary)
+
+    def test_dump(self):
+        for _ in range(2):
+            with Profiler.profile('monitor round'):
+                with Profiler.profile('listVirtualMachines'):
+                    [0] * 1000
+        Profiler.dump()
+        pid = str(os.getpid())
+        files = os.listdir(self.dir.name)
+        self.assertIn(pid + '-monitor_round.prof', files)
+        self.assertNotIn(pid + '-listVirtualMachines.prof', files)
+        with open(os.path.join(self.dir.name, pid + '-summary.txt')) as f:
+            lines = [line.split('\t') for line in f.read().splitlines()]
+        self.assertEqual('listVirtualMachines', lines[1][0])
+        self.assertEqual('2', lines[1][1])
+        self.assertEqual('monitor round', lines[2][0])
+
+    @unittest.skipUnless(hasattr(tracemalloc, 'reset_peak'), 'Python < 3.9')
+    def test_peak_memory(self):
+        with Profiler.profile('big'):
+            big = [0] * 10 ** 6
+            del big
+        self.assertGreater(Profiler._summary['big'][2], 8 * 10 ** 6)
+
+    def test_concurrent_blocks_are_not_measured(self):
+        def other():
+            with Profiler.profile('other'):
+                pass
+
+        with Profiler.profile('big'):
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join()
+            big = [0] * 10 ** 6
+            del big
+        self.assertEqual(0, Profiler._summary['big'][2])
+        self.assertEqual(0, Profiler._summary['other'][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
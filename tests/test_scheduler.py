@@ -0,0 +1,82 @@
+from concurrent.futures import TimeoutError
+import unittest
+from expyrimenter.plugins.cloudstack.scheduler import JobFailed
+from expyrimenter.plugins.cloudstack.simulator import uniform
+from expyrimenter.plugins.cloudstack.tasks import Cancelled, DeadlineExceeded
+from simulated import SimulatedTestCase
+import threading
+
+
+class BlockingProbe:
+    """SSH probe that hangs for vm1 until released."""
+    def __init__(self, ssh):
+        self.ssh = ssh
+        self.released = threading.Event()
+
+    def is_available(self, host):
+        if host == 'vm1':
+            self.released.wait(10)
+            return False
+        return self.ssh.is_available(host)
+
+
+class RefusingProbe:
+    """SSH probe whose logins fail until allowed, e.g. before keys are
+    installed.
+    """
+    def __init__(self, ssh):
+        self.ssh = ssh
+        self.allowed = threading.Event()
+
+    def is_available(self, host):
+        return self.allowed.is_set() and self.ssh.is_available(host)
+
+
+class TestLifecycleScheduler(SimulatedTestCase):
+    def setUp(self):
+        self.names = ['vm1', 'vm2', 'vm3']
+        self.simulate(self.names, boot_time=uniform(60, 60),
+                      ssh_delay=uniform(10, 10))
+
+    def test_start(self):
+        handles = self.cs.start(self.names)
+        for name, handle in handles.items():
+            self.assertEqual(name, handle.result(timeout=10))
+        self.assertGreaterEqual(self.clock.time(), 70)
+
+    def test_deadline(self):
+        handle = self.cs.start('vm1', deadline=30)['vm1']
+        self.assertRaises(DeadlineExceeded, handle.result, 10)
+
+    def test_cancel(self):
+        handle = self.cs.start('vm1')['vm1']
+        handle.cancel()
+        self.assertRaises(Cancelled, handle.result, 10)
+
+    def test_failed_job(self):
+        self.api.failure_rate = 1
+        handle = self.cs.start('vm1')['vm1']
+        self.assertRaises(JobFailed, handle.result, 10)
+
+    def test_ready_only_after_login(self):
+        probe = RefusingProbe(self.api.ssh)
+        self.cs._probe = probe
+        handle = self.cs.start('vm1')['vm1']
+        self.assertRaises(TimeoutError, handle.result, 0.2)
+        self.assertGreater(self.clock.time(), 70)
+        probe.allowed.set()
+        self.assertEqual('vm1', handle.result(timeout=10))
+
+    def test_slow_probe_does_not_block(self):
+        probe = BlockingProbe(self.api.ssh)
+        self.cs._probe = probe
+        self.cs._scheduler.probe_wait = 0.01
+        handles = self.cs.start('vm1', 'vm2', deadline=300)
+        self.assertEqual('vm2', handles['vm2'].result(timeout=10))
+        handles['vm1'].cancel()
+        self.assertRaises(Cancelled, handles['vm1'].result, 10)
+        probe.released.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+from expyrimenter.plugins.cloudstack.simulator import (SimulatedAPI,
+                                                       SimulatedAPIError,
+                                                       VirtualClock, uniform)
+import threading
+import time
+
+
+class TestVirtualClock(unittest.TestCase):
+    def test_advance_fires_events_in_order(self):
+        clock = VirtualClock()
+        fired = []
+        clock.schedule(20, fired.append, 'b')
+        clock.schedule(10, fired.append, 'a')
+        clock.advance(15)
+        self.assertEqual(['a'], fired)
+        clock.advance(5)
+        self.assertEqual(['a', 'b'], fired)
+        self.assertEqual(20, clock.time())
+
+    def test_sleep_does_not_take_real_time(self):
+        clock = VirtualClock()
+        clock.sleep(3600)
+        self.assertEqual(3600, clock.time())
+
+    def test_concurrent_sleepers_wake_up_in_order(self):
+        clock = VirtualClock()
+        woken = []
+
+        def sleeper(seconds):
+            clock.sleep(seconds)
+            woken.append((seconds, clock.time()))
+
+        threads = [threading.Thread(target=sleeper, args=(s,))
+                   for s in (30, 10, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([(10, 10), (20, 20), (30, 30)], woken)
+
+    def test_time_waits_for_registered_threads(self):
+        clock = VirtualClock()
+        times = []
+
+        def busy():
+            for _ in range(3):
+                time.sleep(0.01)  # longer than the settle time
+                times.append(clock.time())
+                clock.sleep(10)
+
+        def ticker():
+            for _ in range(30):
+                clock.sleep(1)
+
+        threads = [clock.thread(busy), clock.thread(ticker)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([0, 10, 20], times)
+
+
+class TestSimulatedAPI(unittest.TestCase):
+    def setUp(self):
+        self.api = SimulatedAPI(seed=1, boot_time=uniform(60, 60),
+                                ssh_delay=uniform(10, 10),
+                                stop_time=uniform(5, 5))
+        self.clock = self.api.clock
+        self.vm_id = self.api.add_vm('vm1')
+
+    def _state(self):
+        return self.api.listVirtualMachines(id=self.vm_id)[
+            'virtualmachine'][0]['state']
+
+    def test_start_goes_through_starting(self):
+        self.api.startVirtualMachine(id=self.vm_id)
+        self.assertEqual('Starting', self._state())
+        self.clock.advance(60)
+        self.assertEqual('Running', self._state())
+
+    def test_ssh_is_ready_after_delay(self):
+        self.api.startVirtualMachine(id=self.vm_id)
+        self.clock.advance(60)
+        self.assertFalse(self.api.is_ssh_ready('vm1'))
+        self.clock.advance(10)
+        self.assertTrue(self.api.is_ssh_ready('vm1'))
+
+    def test_async_job_result(self):
+        job = self.api.startVirtualMachine(id=self.vm_id)
+        result = self.api.queryAsyncJobResult(jobid=job['jobid'])
+        self.assertEqual(0, result['jobstatus'])
+        self.clock.advance(60)
+        result = self.api.queryAsyncJobResult(jobid=job['jobid'])
+        self.assertEqual(1, result['jobstatus'])
+
+    def test_failed_start_stops_vm(self):
+        self.api.failure_rate = 1
+        job = self.api.startVirtualMachine(id=self.vm_id)
+        self.clock.advance(60)
+        self.assertEqual('Stopped', self._state())
+        result = self.api.queryAsyncJobResult(jobid=job['jobid'])
+        self.assertEqual(2, result['jobstatus'])
+
+    def test_stop(self):
+        self.api.startVirtualMachine(id=self.vm_id)
+        self.clock.advance(60)
+        self.api.stopVirtualMachine(id=self.vm_id)
+        self.assertEqual('Stopping', self._state())
+        self.clock.advance(5)
+        self.assertEqual('Stopped', self._state())
+
+    def test_start_while_starting_raises(self):
+        self.api.startVirtualMachine(id=self.vm_id)
+        self.assertRaises(SimulatedAPIError, self.api.startVirtualMachine,
+                          id=self.vm_id)
+
+    def test_deploy_existing_name_raises(self):
+        self.assertRaises(SimulatedAPIError, self.api.deployVirtualMachine,
+                          name='vm1')
+
+    def test_pagesize_requires_page(self):
+        self.api.startVirtualMachine(id=self.vm_id)
+        self.assertRaises(SimulatedAPIError, self.api.listEvents, pagesize=1)
+        self.assertEqual(1, len(self.api.listEvents(page=1,
+                                                    pagesize=1)['event']))
+
+    def test_durations_do_not_depend_on_call_order(self):
+        draws = []
+        for order in ('vm1', 'vm2'), ('vm2', 'vm1'):
+            drawn = {}
+
+            def boot_time(rng, vm):
+                drawn[vm['name']] = rng.random()
+                return 60
+
+            api = SimulatedAPI(seed=1, boot_time=boot_time)
+            ids = {name: api.add_vm(name) for name in order}
+            for name in order:
+                api.startVirtualMachine(id=ids[name])
+            draws.append(drawn)
+        self.assertEqual(draws[0], draws[1])
+
+    def test_empty_list_has_no_key(self):
+        self.assertEqual({}, self.api.listVirtualMachines(name='none'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from expyrimenter.plugins.cloudstack.starttimes import StartTimes
+import os
+import tempfile
+
+
+class TestStartTimes(unittest.TestCase):
+    def setUp(self):
+        self.times = StartTimes(path=False, history=3)
+
+    def test_estimate_is_median_of_history(self):
+        for duration in 100, 10, 20, 30:
+            self.times.record('vm1', duration)
+        self.assertEqual(20, self.times.estimate('vm1'))
+
+    def test_record_at_least(self):
+        self.times.record('vm1', 20)
+        self.times.record_at_least('vm1', 10)
+        self.assertEqual(20, self.times.estimate('vm1'))
+        self.times.record_at_least('vm1', 40)
+        self.assertEqual(30, self.times.estimate('vm1'))
+
+    def test_estimate_without_history(self):
+        self.assertIsNone(self.times.estimate('vm1'))
+
+    def test_rank_prefers_fastest(self):
+        self.times.record('slow', 100)
+        self.times.record('fast', 10)
+        self.assertEqual(['fast', 'slow'], self.times.rank(['slow', 'fast']))
+
+    def test_rank_spreads_hosts(self):
+        for vm, duration, host in [('a1', 10, 'a'), ('a2', 11, 'a'),
+                                   ('b1', 20, 'b')]:
+            self.times.record(vm, duration)
+            self.times.set_host(vm, host)
+        self.assertEqual(['a1', 'b1', 'a2'],
+                         self.times.rank(['a1', 'a2', 'b1']))
+
+    def test_rank_unknown_vms_get_median(self):
+        for vm, duration in ('vm1', 10), ('vm2', 20), ('vm3', 30):
+            self.times.record(vm, duration)
+        ranked = self.times.rank(['new', 'vm3', 'vm1'])
+        self.assertEqual(['vm1', 'new', 'vm3'], ranked)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'times.json')
+            times = StartTimes(path)
+            times.record('vm1', 42)
+            times.set_host('vm1', 'host1')
+            times.save()
+            loaded = StartTimes(path)
+            self.assertEqual(42, loaded.estimate('vm1'))
+            self.assertEqual('host1', loaded.host('vm1'))
+
+    def test_saves_are_merged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'times.json')
+            first, second = StartTimes(path), StartTimes(path)
+            first.record('vm1', 10)
+            second.record('vm1', 30)
+            second.record('vm2', 20)
+            first.save()
+            second.save()
+            loaded = StartTimes(path)
+            self.assertEqual(20, loaded.estimate('vm1'))
+            self.assertEqual(20, loaded.estimate('vm2'))
+            self.assertEqual(20, second.estimate('vm1'))
+
+    def test_corrupt_file_is_ignored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'times.json')
+            with open(path, 'w') as f:
+                f.write('{"vm1": ')
+            times = StartTimes(path)
+            self.assertIsNone(times.estimate('vm1'))
+            times.record('vm1', 42)
+            times.save()
+            self.assertEqual(42, StartTimes(path).estimate('vm1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
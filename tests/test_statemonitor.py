@@ -0,0 +1,59 @@
+import unittest
+from expyrimenter.plugins.cloudstack.simulator import SimulatedAPI, uniform
+from expyrimenter.plugins.cloudstack.statemonitor import StateMonitor
+
+
+class TestIncrementalStateMonitor(unittest.TestCase):
+    def setUp(self):
+        self.api = SimulatedAPI(seed=1, boot_time=uniform(60, 60))
+        self.clock = self.api.clock
+        self.ids = [self.api.add_vm('vm{}'.format(i)) for i in range(3)]
+        self.states = {}
+        self.sm = StateMonitor(self.states, self.api, self.clock,
+                               incremental=True, full_every=100)
+        self.sm._monitor_states_once()
+        self.api.calls.clear()
+
+    def test_events_update_states(self):
+        self.api.startVirtualMachine(id=self.ids[0])
+        self.sm._monitor_states_once()
+        self.assertEqual('Starting', self.states['vm0'])
+        self.clock.advance(60)
+        self.sm._monitor_states_once()
+        self.assertEqual('Running', self.states['vm0'])
+        self.assertEqual('Stopped', self.states['vm1'])
+        self.assertEqual(0, self.api.calls['listVirtualMachines'])
+
+    def test_failed_start_is_reconciled(self):
+        self.api.failure_rate = 1
+        self.api.startVirtualMachine(id=self.ids[0])
+        self.clock.advance(60)
+        self.sm._monitor_states_once()
+        self.assertEqual('Stopped', self.states['vm0'])
+        self.assertEqual(1, self.api.calls['listVirtualMachines'])
+
+    def test_new_vm_is_reconciled(self):
+        self.api.deployVirtualMachine(name='new')
+        self.sm._monitor_states_once()
+        self.assertEqual('Starting', self.states['new'])
+
+    def test_events_without_vm_ids(self):
+        list_events = self.api.listEvents
+
+        def without_ids(**kwargs):
+            response = list_events(**kwargs)
+            for event in response.get('event', []):
+                del event['resourceid']
+            return response
+
+        self.api.listEvents = without_ids
+        self.api.startVirtualMachine(id=self.ids[0])
+        for _ in range(3):
+            self.sm._monitor_states_once()
+        self.assertEqual('Starting', self.states['vm0'])
+        self.assertEqual(1, self.api.calls['listEvents'])
+        self.assertEqual(3, self.api.calls['listVirtualMachines'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import socket
+import unittest
+from unittest.mock import patch
+from expyrimenter.plugins.cloudstack.simulator import VirtualClock, uniform
+from expyrimenter.plugins.cloudstack.tasks import (CancelToken, Cancelled,
+                                                   DeadlineExceeded, SSHProbe)
+from simulated import SimulatedTestCase
+import time
+
+
+class TestCancelToken(unittest.TestCase):
+    def test_no_deadline(self):
+        token = CancelToken(VirtualClock())
+        self.assertIsNone(token.remaining())
+        token.sleep(3600)
+
+    def test_deadline_cuts_sleep(self):
+        clock = VirtualClock()
+        token = CancelToken(clock, deadline=30)
+        self.assertRaises(DeadlineExceeded, token.sleep, 3600)
+        self.assertEqual(30, clock.time())
+
+    def test_cancelled(self):
+        token = CancelToken(VirtualClock())
+        token.cancel()
+        self.assertTrue(token.cancelled)
+        self.assertRaises(Cancelled, token.check)
+
+    def test_cancel_wakes_real_sleep(self):
+        token = CancelToken()
+        token.cancel()
+        self.assertRaises(Cancelled, token.sleep, 3600)
+
+
+class TestSSHProbe(unittest.TestCase):
+    @patch('expyrimenter.plugins.cloudstack.tasks.subprocess.call')
+    def test_login(self, call):
+        call.return_value = 0
+        self.assertTrue(SSHProbe().is_available('alias'))
+        self.assertEqual(['alias', 'exit'], call.call_args[0][0][-2:])
+        call.return_value = 255
+        self.assertFalse(SSHProbe().is_available('alias'))
+
+    @patch('expyrimenter.plugins.cloudstack.tasks.subprocess.call')
+    def test_closed_port_skips_login(self, call):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.assertFalse(SSHProbe(port=port).is_available('127.0.0.1'))
+        self.assertFalse(call.called)
+
+
+class TestExecutorTasks(SimulatedTestCase):
+    """Tasks of CloudStack objects without the scheduler."""
+    def setUp(self):
+        self.simulate(['vm1'], scheduler=False, boot_time=uniform(60, 60),
+                      ssh_delay=uniform(10, 10))
+
+    def test_deadline(self):
+        handle = self.cs.start('vm1', deadline=30)['vm1']
+        self.assertRaises(DeadlineExceeded, handle.result, 10)
+        self._assert_monitor_released()
+
+    def test_cancel_wakes_real_wait(self):
+        self.cs.clock = time
+        handle = self.cs.start('vm1')['vm1']
+        time.sleep(0.1)  # waiting for 10 s
+        handle.cancel()
+        self.assertRaises(Cancelled, handle.result, 5)
+        self._assert_monitor_released()
+
+    def _assert_monitor_released(self):
+        """The monitor is released by a callback that may run after the
+        result is available.
+        """
+        for _ in range(100):
+            if not self.cs._sm_tasks:
+                break
+            time.sleep(0.01)
+        self.assertEqual(0, self.cs._sm_tasks)
+
+
+if __name__ == '__main__':
+    unittest.main()